@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+from telethon import errors
+from telethon.tl import types, functions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOT_ID = 777000001
+BOT_USERNAME = "bench_bot"
+PEER_BASE = -1009000000000
+TARGET_BASE = 5000000000
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Offline throughput benchmark for main.py using a fake Telegram client.")
+    ap.add_argument("--admins", type=int, default=4, help="concurrent admins issuing commands")
+    ap.add_argument("--targets", type=int, default=100, help="distinct targets in the command phase")
+    ap.add_argument("--invites", type=int, default=2000, help="live invites registered for the watch phase")
+    ap.add_argument("--joins", type=int, default=100, help="ChatAction joins in the join phase")
+    ap.add_argument("--addv-ratio", type=float, default=0.5, help="share of .addvN (combo) vs .linkvN commands")
+    ap.add_argument("--latency-ms", type=float, default=40, help="mean simulated RPC latency")
+    ap.add_argument("--jitter-ms", type=float, default=20, help="uniform +/- jitter on RPC latency")
+    ap.add_argument("--flood-rate", type=float, default=0.0, help="probability an RPC raises FloodWait")
+    ap.add_argument("--flood-sec", type=int, default=1, help="FloodWait seconds when raised")
+    ap.add_argument("--bot-reply-ms", type=float, default=300, help="delay before the target bot answers a relay")
+    ap.add_argument("--bot-reply-rate", type=float, default=0.95, help="share of relays the bot answers")
+    ap.add_argument("--bot-timeout", type=float, default=4, help="behavior.wait_bot_reply_sec")
+    ap.add_argument("--request-rate", type=float, default=0.1, help="share of watched links that get a join request")
+    ap.add_argument("--watch-sec", type=float, default=10, help="duration of the watch phase")
+    ap.add_argument("--join-mode", choices=("push", "poll"), default="poll", help="behavior.join_request_mode")
+    ap.add_argument("--workers", type=int, default=8, help="behavior.invite_workers")
+    ap.add_argument("--pool-depth", type=int, default=0, help="vip_invite.pool_depth")
+    ap.add_argument("--no-rate-limit", action="store_true", help="lift RpcScheduler buckets to measure code overhead")
+    ap.add_argument("--phases", default="commands,watch,joins", help="comma separated subset to run")
+    ap.add_argument("--tracemalloc", action="store_true", help="track Python heap peak (slower)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="also append the report to this file")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary workdir (audit log, sqlite stores)")
+    return ap.parse_args()
+
+
+def bench_config(args, workdir: str) -> dict:
+    tiers = {f"linkv{i}": str(PEER_BASE - i) for i in range(1, 7)}
+    cfg = {
+        "telegram": {"api_id": 1, "api_hash": "0", "session": "bench", "string_session": "",
+                     "prefer_string_session": True},
+        "admin": {"admin_ids": [100 + i for i in range(max(1, args.admins))]},
+        "bot_target": {"username": BOT_USERNAME, "commands": {f"v{i}": f"/addv{i}" for i in range(1, 7)}},
+        "behavior": {
+            "combo_addv_plus_link": True,
+            "combo_order": "relay_first",
+            "wait_bot_reply_sec": args.bot_timeout,
+            "dedupe_cache_sec": 0,
+            "silent_dm_to_user": True,
+            "invite_workers": args.workers,
+            "join_request_mode": args.join_mode,
+        },
+        "vip_invite": {"map": tiers, "ttl_sec": 86400, "limit": 1, "pool_depth": args.pool_depth},
+        "storage": {
+            "notes": os.path.join(workdir, "data", "notes.json"),
+            "invite_log": os.path.join(workdir, "data", "invite_audit.jsonl"),
+        },
+    }
+    if args.no_rate_limit:
+        cfg["rpc"] = {"max_inflight": 10 ** 6, "default_rate": [10 ** 6, 10 ** 6],
+                      "rates": {k: [10 ** 6, 10 ** 6] for k in (
+                          "ExportChatInviteRequest", "EditExportedChatInviteRequest",
+                          "HideAllChatJoinRequestsRequest", "GetExportedChatInvitesRequest",
+                          "send_message", "get_entity", "iter_download")}}
+    return cfg
+
+
+class FakeMessage:
+    def __init__(self, id_: int, text: str, reply_to: int = None):
+        self.id = id_
+        self.raw_text = text
+        self.text = text
+        self.reply_to_msg_id = reply_to
+
+    async def edit(self, text: str):
+        self.raw_text = self.text = text
+        return self
+
+
+class FakeBotReply:
+    is_private = True
+    sender_id = BOT_ID
+
+    def __init__(self, message: FakeMessage):
+        self.message = message
+        self.raw_text = message.raw_text
+
+
+class FakeAdminEvent:
+    is_reply = False
+    is_private = True
+
+    def __init__(self, sender: int, id_: int, text: str):
+        self.sender_id = sender
+        self.chat_id = sender
+        self.id = id_
+        self.raw_text = text
+
+    async def reply(self, text: str):
+        return FakeMessage(0, text)
+
+    async def get_reply_message(self):
+        return None
+
+
+class FakeUser:
+    def __init__(self, id_: int):
+        self.id = id_
+
+
+class FakeChatAction:
+    user_joined = True
+    user_added = False
+
+    def __init__(self, uid: int, chat_id: int):
+        self.uid = uid
+        self.chat_id = chat_id
+
+    async def get_user(self):
+        return FakeUser(self.uid)
+
+
+class FakeClient:
+    def __init__(self, args, mod):
+        self.args = args
+        self.mod = mod
+        self.rpcs = {}
+        self.floods = 0
+        self.msg_id = 0
+        self.invite_id = 0
+        self.requested = {}
+
+    async def _rpc(self, name: str):
+        self.rpcs[name] = self.rpcs.get(name, 0) + 1
+        a = self.args
+        delay = max(0.0, a.latency_ms + random.uniform(-a.jitter_ms, a.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if a.flood_rate and random.random() < a.flood_rate:
+            self.floods += 1
+            raise errors.FloodWaitError(request=None, capture=a.flood_sec)
+
+    async def __call__(self, request):
+        await self._rpc(type(request).__name__)
+        if isinstance(request, functions.messages.ExportChatInviteRequest):
+            self.invite_id += 1
+            link = f"https://t.me/+bench{self.invite_id:08d}"
+            if random.random() < self.args.request_rate:
+                self.requested[link] = 1
+            return types.ChatInviteExported(link=link, admin_id=0, date=None, request_needed=True)
+        if isinstance(request, functions.messages.GetExportedChatInvitesRequest):
+            links = self.mod.WATCHER.by_peer.get(self.mod.utils.get_peer_id(request.peer), {})
+            invites = [
+                types.ChatInviteExported(link=l, admin_id=0, date=None, requested=self.requested.get(l, 0))
+                for l in links
+            ]
+            return types.messages.ExportedChatInvites(count=len(invites), invites=invites, users=[])
+        return None
+
+    async def get_entity(self, key):
+        await self._rpc("get_entity")
+        if isinstance(key, str) and key.lower() == "@" + BOT_USERNAME:
+            return types.InputPeerUser(BOT_ID, 1)
+        if isinstance(key, str):
+            return types.InputPeerUser(abs(hash(key)) % 10 ** 9 + 10 ** 9, 1)
+        if key < 0:
+            return types.InputPeerChannel(int(str(key)[4:]), 1)
+        return types.InputPeerUser(key, 1)
+
+    async def get_dialogs(self, limit=None):
+        await self._rpc("get_dialogs")
+        return []
+
+    async def send_message(self, peer, text, **kwargs):
+        await self._rpc("send_message")
+        self.msg_id += 1
+        msg = FakeMessage(self.msg_id, text)
+        if getattr(peer, "user_id", None) == BOT_ID and random.random() < self.args.bot_reply_rate:
+            asyncio.get_event_loop().call_later(self.args.bot_reply_ms / 1000, self._bot_reply, msg)
+        return msg
+
+    def _bot_reply(self, relayed: FakeMessage):
+        self.msg_id += 1
+        target = relayed.raw_text.split()[1] if len(relayed.raw_text.split()) > 1 else ""
+        reply = FakeMessage(self.msg_id, f"OK {target} ditambahkan", reply_to=relayed.id)
+        asyncio.ensure_future(self.mod.on_bot_reply(FakeBotReply(reply)))
+
+
+def pct(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def lat_line(label: str, values: list) -> str:
+    ms = [v * 1000 for v in values]
+    return (f"  {label:<22} n={len(ms):<6} p50={pct(ms, 0.5):8.1f}ms  p90={pct(ms, 0.9):8.1f}ms  "
+            f"p99={pct(ms, 0.99):8.1f}ms  max={max(ms) if ms else 0:8.1f}ms")
+
+
+def hist_line(mod, label: str, name: str) -> str:
+    h = mod.METRICS.hists.get((name, None))
+    if h is None or not h.n:
+        return f"  {label:<22} n=0"
+    return (f"  {label:<22} n={h.n:<6} p50={h.quantile(0.5) * 1000:8.1f}ms  "
+            f"p99={h.quantile(0.99) * 1000:8.1f}ms  (histogram estimate)")
+
+
+async def phase_commands(args, mod, fake, report: list):
+    admins = sorted(mod.ADMIN_IDS)
+    targets = [TARGET_BASE + i for i in range(args.targets)]
+    work = asyncio.Queue()
+    for i, t in enumerate(targets):
+        tier = random.randint(1, 6)
+        cmd = f".addv{tier}" if random.random() < args.addv_ratio else f".linkv{tier}"
+        work.put_nowait((i, f"{cmd} {t}"))
+    handler_lat = []
+
+    async def admin(sender: int):
+        while not work.empty():
+            i, text = work.get_nowait()
+            t0 = time.monotonic()
+            await mod.admin_handler(FakeAdminEvent(sender, i + 1, text))
+            handler_lat.append(time.monotonic() - t0)
+
+    rpc_before = sum(fake.rpcs.values())
+    started = time.monotonic()
+    await asyncio.gather(*(admin(a) for a in admins))
+    accepted = time.monotonic() - started
+    while mod.INVITE_JOBS.waiting or mod.INVITE_JOBS.depth() or mod.INVITE_JOBS.running:
+        await asyncio.sleep(0.01)
+    drained = time.monotonic() - started
+    sent = len(mod.INVITES)
+    report.append(f"[commands] {len(targets)} commands from {len(admins)} admins")
+    report.append(f"  accepted in {accepted:.2f}s ({len(targets) / max(accepted, 1e-9):.0f} cmd/s), "
+                  f"all DMs done in {drained:.2f}s ({len(targets) / max(drained, 1e-9):.1f} cmd/s end-to-end)")
+    report.append(f"  invites live: {sent}, RPCs issued: {sum(fake.rpcs.values()) - rpc_before}")
+    report.append(lat_line("admin_handler", handler_lat))
+    report.append(hist_line(mod, "addv -> DM", "addv_to_dm_seconds"))
+    report.append(hist_line(mod, "linkv -> DM", "linkv_to_dm_seconds"))
+
+
+async def phase_watch(args, mod, fake, report: list):
+    tiers = list(mod.VIP_MAP)
+    base = len(mod.INVITES)
+    for i in range(args.invites):
+        fake.invite_id += 1
+        link = f"https://t.me/+watch{fake.invite_id:08d}"
+        if random.random() < args.request_rate:
+            fake.requested[link] = 1
+        mod.register_invite(tiers[i % len(tiers)], TARGET_BASE + args.targets + i, link)
+    polls_before = fake.rpcs.get("GetExportedChatInvitesRequest", 0)
+    revokes_before = fake.rpcs.get("EditExportedChatInviteRequest", 0)
+    for peer in list(mod.WATCHER.by_peer):
+        mod.WATCHER.poke(peer)
+    await asyncio.sleep(args.watch_sec)
+    polls = fake.rpcs.get("GetExportedChatInvitesRequest", 0) - polls_before
+    revokes = fake.rpcs.get("EditExportedChatInviteRequest", 0) - revokes_before
+    report.append(f"[watch] {args.invites} invites registered on top of {base} for {args.watch_sec:.0f}s "
+                  f"({args.join_mode} mode)")
+    report.append(f"  watchers live: {len(mod.WATCHER)}, poll RPCs: {polls} ({polls / args.watch_sec:.1f}/s), "
+                  f"revokes on request: {revokes}")
+    report.append(hist_line(mod, "watcher poll", "watch_poll_seconds"))
+
+
+async def phase_joins(args, mod, fake, report: list):
+    recs = list(mod.INVITES.by_target.values())
+    random.shuffle(recs)
+    events_ = [FakeChatAction(r.target, r.peer) for r in recs[:args.joins]]
+    while len(events_) < args.joins:
+        events_.append(FakeChatAction(TARGET_BASE * 2 + len(events_), PEER_BASE - 1))
+    lat = []
+
+    async def one(ev):
+        t0 = time.monotonic()
+        await mod.on_chat_action(ev)
+        lat.append(time.monotonic() - t0)
+
+    live_before = len(mod.INVITES)
+    rpc_before = sum(fake.rpcs.values())
+    started = time.monotonic()
+    await asyncio.gather(*(one(ev) for ev in events_))
+    took = time.monotonic() - started
+    report.append(f"[joins] {len(events_)} ChatAction joins in {took:.2f}s ({len(events_) / max(took, 1e-9):.0f}/s)")
+    report.append(f"  invites consumed: {live_before - len(mod.INVITES)}, RPCs issued: {sum(fake.rpcs.values()) - rpc_before}")
+    report.append(lat_line("on_chat_action", lat))
+
+
+async def run(args, mod, fake) -> list:
+    report = []
+    await mod.RESOLVER.warm([mod.tier_peer_id(k) for k in mod.VIP_MAP] + ["@" + BOT_USERNAME])
+    if args.pool_depth:
+        mod.POOL.start()
+        while mod.POOL.size() < args.pool_depth * len(mod.VIP_MAP):
+            await asyncio.sleep(0.05)
+    phases = {"commands": phase_commands, "watch": phase_watch, "joins": phase_joins}
+    for name in [p.strip() for p in args.phases.split(",") if p.strip()]:
+        await phases[name](args, mod, fake, report)
+    await mod.shutdown()
+    await mod.EXPIRY.stop()
+    return report
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="usher-bench-")
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(bench_config(args, workdir), f)
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    if args.tracemalloc:
+        tracemalloc.start()
+    import main as mod
+    logging.getLogger().setLevel(logging.WARNING)
+    fake = FakeClient(args, mod)
+    mod.client = fake
+    mod.RPC.client = fake
+    mod.RESOLVER.client = fake
+    mod.PRIMARY.client = fake
+
+    started = time.monotonic()
+    report = asyncio.run(run(args, mod, fake))
+    mod.AUDIT.close()
+    total = time.monotonic() - started
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    header = [
+        f"usher bench  admins={args.admins} targets={args.targets} invites={args.invites} joins={args.joins} "
+        f"latency={args.latency_ms:.0f}±{args.jitter_ms:.0f}ms flood={args.flood_rate} "
+        f"rate_limit={'off' if args.no_rate_limit else 'on'} pool={args.pool_depth}",
+    ]
+    footer = [
+        f"[rpc] total {sum(fake.rpcs.values())}, FloodWait injected {fake.floods}",
+        "  " + ", ".join(f"{k}={v}" for k, v in sorted(fake.rpcs.items())),
+        f"[memory] max RSS {rss:.1f} MiB" + (
+            f", Python heap peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f} MiB" if args.tracemalloc else ""),
+        f"[total] {total:.2f}s" + (f", workdir {workdir}" if args.keep else ""),
+    ]
+    text = "\n".join(header + report + footer)
+    print(text)
+    os.chdir(HERE)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.out:
+        with open(os.path.join(HERE, args.out) if not os.path.isabs(args.out) else args.out, "a", encoding="utf-8") as f:
+            f.write(text + "\n\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,34 @@
 import os
+import re
 import json
+import base64
+import hashlib
 import time
+import gzip
+import queue
+import atexit
 import asyncio
+import contextvars
 import logging
+from collections import OrderedDict, deque
+import heapq
+import bisect
+import difflib
+import itertools
 import shutil
+import sqlite3
+import threading
 from typing import Optional
 from datetime import datetime, timezone
 
-from telethon import TelegramClient, events, functions
+from telethon import TelegramClient, events, functions, utils
+from telethon import errors
 from telethon.errors import SessionPasswordNeededError
 from telethon.sessions import StringSession
 from telethon.tl import types
 
+from report import audit_segments, open_segment, parse_bound, run_report, REPORTS
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(message)s", datefmt="%H:%M:%S")
 log = logging.getLogger("usher")
 
@@ -30,6 +47,90 @@ def save_cfg(cfg: dict):
     os.replace(tmp, CFG_PATH)
 
 
+def cfg_settings(cfg: dict) -> dict:
+    behav = cfg["behavior"]
+    vip = cfg["vip_invite"]
+    rpc_cfg = cfg.get("rpc", {})
+    watch_rate = float(behav.get("watch_rpc_per_sec", 3))
+    rates = {
+        "ExportChatInviteRequest": (2, 5),
+        "EditExportedChatInviteRequest": (3, 5),
+        "HideAllChatJoinRequestsRequest": (3, 5),
+        "GetExportedChatInvitesRequest": (watch_rate, 1),
+        "send_message": (5, 10),
+        "get_entity": (5, 10),
+        "iter_download": (500, 50),
+    }
+    rates.update({k: tuple(v) for k, v in rpc_cfg.get("rates", {}).items()})
+    return {
+        "ADMIN_IDS": set(int(x) for x in cfg["admin"]["admin_ids"]),
+        "BOT_USERNAME": cfg["bot_target"]["username"],
+        "CMD_MAP": dict(cfg["bot_target"]["commands"]),
+        "BEHAV": behav,
+        "COMBO_ON": bool(behav.get("combo_addv_plus_link", True)),
+        "COMBO_ORDER": behav.get("combo_order", "relay_first"),
+        "WAIT_BOT_REPLY": int(behav.get("wait_bot_reply_sec", 5)),
+        "DEDUPE_SEC": int(behav.get("dedupe_cache_sec", 60)),
+        "BULK_CONCURRENCY": int(behav.get("bulk_concurrency", 5)),
+        "BULK_MAX_TARGETS": int(behav.get("bulk_max_targets", 500)),
+        "BULK_PROGRESS_SEC": float(behav.get("bulk_progress_sec", 3)),
+        "BULK_FILE_MAX": int(behav.get("bulk_file_max_kb", 512)) * 1024,
+        "FANOUT_CONCURRENCY": int(behav.get("fanout_concurrency", 4)),
+        "FANOUT_MAX_TARGETS": int(behav.get("fanout_max_targets", 5000)),
+        "CMD_LIMITS": dict(behav.get("command_limits", {"bulkaddv": 1, "bulklinkv": 1, "sendnote": 1, "report": 1})),
+        "SILENT_DM": bool(behav.get("silent_dm_to_user", True)),
+        "ADDV_MIN": int(behav.get("addv_req_min", 1)),
+        "ADDV_MAX": int(behav.get("addv_req_max", 100)),
+        "NOTES_PREVIEW_LEN": int(behav.get("notes_list_preview_len", 160)),
+        "NOTES_LIST_MAX": int(behav.get("notes_list_max_items", 50)),
+        "NOTES_FIND_MAX": int(behav.get("notes_find_max_items", 20)),
+        "NOTES_FUZZY_CUTOFF": float(behav.get("notes_fuzzy_cutoff", 0.6)),
+        "REPORT_INDEX": bool(behav.get("report_index", True)),
+        "REPORT_LIMIT": int(behav.get("report_max_rows", 20)),
+        "ENTITY_CACHE_MAX": int(behav.get("entity_cache_max", 4096)),
+        "ENTITY_CACHE_TTL": int(behav.get("entity_cache_ttl_sec", 6 * 3600)),
+        "WATCH_INTERVAL_MAX": int(behav.get("watch_interval_max_sec", 30)),
+        "WATCH_BACKOFF_AFTER": int(behav.get("watch_backoff_after_sec", 60)),
+        "WATCH_RPC_PER_SEC": watch_rate,
+        "JOIN_REQ_MODE": behav.get("join_request_mode", "push"),
+        "WATCH_RECONCILE": int(behav.get("watch_reconcile_sec", 60)),
+        "VIP": vip,
+        "VIP_MAP": dict(vip["map"]),
+        "TTL": int(vip.get("ttl_sec", 86400)),
+        "LIMIT": int(vip.get("limit", 1)),
+        "POOL_DEPTH": vip.get("pool_depth", 0),
+        "POOL_MAX_AGE": int(vip.get("pool_max_age_sec", 3600)),
+        "POOL_REFILL_SEC": float(vip.get("pool_refill_sec", 30)),
+        "EXPIRE_REVOKE": bool(vip.get("revoke_on_expire", False)),
+        "INVITE_TPL": vip.get("template", "Akses {tier} aktif.\nLink (berlaku 24 jam, 1x pakai): {link}"),
+        "RPC_CFG": rpc_cfg,
+        "RPC_MAX_INFLIGHT": int(rpc_cfg.get("max_inflight", 8)),
+        "RPC_FLOOD_RETRIES": int(rpc_cfg.get("flood_retries", 3)),
+        "RPC_FLOOD_MAX_WAIT": int(rpc_cfg.get("flood_max_wait_sec", 300)),
+        "RPC_DEFAULT_RATE": tuple(rpc_cfg.get("default_rate", (10, 20))),
+        "RPC_RATES": rates,
+    }
+
+
+def check_settings(out: dict):
+    if not out["ADMIN_IDS"]:
+        raise ValueError("admin.admin_ids kosong")
+    for k, v in out["VIP_MAP"].items():
+        try:
+            int(str(v).strip())
+        except ValueError:
+            raise ValueError(f"vip_invite.map.{k} bukan peer id: {v}")
+    if out["JOIN_REQ_MODE"] not in ("push", "poll"):
+        raise ValueError(f"behavior.join_request_mode tidak dikenal: {out['JOIN_REQ_MODE']}")
+    for k, v in list(out["RPC_RATES"].items()) + [("default_rate", out["RPC_DEFAULT_RATE"])]:
+        if len(v) != 2:
+            raise ValueError(f"rpc rate {k} harus [rate, burst]")
+    try:
+        out["INVITE_TPL"].format(tier="VIP1", link="https://t.me/+x")
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"vip_invite.template tidak valid: {e}")
+
+
 CFG = load_cfg()
 
 API_ID = int(CFG["telegram"]["api_id"])
@@ -38,49 +139,206 @@ SESSION_FILE = CFG["telegram"]["session"]
 STRING_SESSION = (CFG["telegram"].get("string_session") or "").strip()
 PREFER_STRING = bool(CFG["telegram"].get("prefer_string_session", True))
 
-ADMIN_IDS = set(int(x) for x in CFG["admin"]["admin_ids"])
-BOT_USERNAME = CFG["bot_target"]["username"]
-CMD_MAP = CFG["bot_target"]["commands"]
-
-BEHAV = CFG["behavior"]
-COMBO_ON = bool(BEHAV.get("combo_addv_plus_link", True))
-COMBO_ORDER = BEHAV.get("combo_order", "relay_first")
-WAIT_BOT_REPLY = int(BEHAV.get("wait_bot_reply_sec", 5))
-SILENT_DM = bool(BEHAV.get("silent_dm_to_user", True))
-ADDV_MIN = int(BEHAV.get("addv_req_min", 1))
-ADDV_MAX = int(BEHAV.get("addv_req_max", 100))
-NOTES_PREVIEW_LEN = int(BEHAV.get("notes_list_preview_len", 160))
-NOTES_LIST_MAX = int(BEHAV.get("notes_list_max_items", 50))
-
-VIP = CFG["vip_invite"]
-VIP_MAP = VIP["map"]
-TTL = int(VIP.get("ttl_sec", 86400))
-LIMIT = int(VIP.get("limit", 1))
-INVITE_TPL = VIP.get("template", "Akses {tier} aktif.\nLink (berlaku 24 jam, 1x pakai): {link}")
+globals().update(cfg_settings(CFG))
+INVITE_WORKERS = int(BEHAV.get("invite_workers", 8))
+INVITE_QUEUE_MAX = int(BEHAV.get("invite_queue_max", 1000))
+CONFIG_WATCH_SEC = float(BEHAV.get("config_watch_sec", 5))
 
 STO = CFG["storage"]
 NOTES_PATH = STO["notes"]
+NOTES_MEDIA_DIR = STO.get("notes_media", os.path.join("data", "notes_media"))
+NOTES_BLOB_DIR = STO.get("notes_blobs", os.path.join(os.path.dirname(os.path.normpath(NOTES_MEDIA_DIR)), "notes_blobs"))
+NOTES_MEDIA_MAX = int(float(STO.get("notes_media_max_mb", 2048)) * 1024 * 1024)
+NOTES_DB_PATH = STO.get("notes_db", os.path.splitext(NOTES_PATH)[0] + ".sqlite3")
 INVITE_LOG = STO["invite_log"]
+LOG_FLUSH_SEC = float(STO.get("invite_log_flush_sec", 1.0))
+LOG_BATCH_MAX = int(STO.get("invite_log_batch", 256))
+LOG_ROTATE_BYTES = int(float(STO.get("invite_log_rotate_mb", 64)) * 1024 * 1024)
+LOG_ROTATE_DAILY = bool(STO.get("invite_log_rotate_daily", True))
+ENTITY_DB_PATH = STO.get("entities", os.path.join("data", "entities.sqlite3"))
+INVITE_STATE_PATH = STO.get("invite_state", os.path.join(os.path.dirname(INVITE_LOG), "invite_state.sqlite3"))
+INVITE_INDEX_PATH = STO.get("invite_index", os.path.join(os.path.dirname(INVITE_LOG), "invite_index.sqlite3"))
+AUDIT_INDEX_PATH = STO.get("audit_index", os.path.join(os.path.dirname(INVITE_LOG), "audit_index.sqlite3"))
 
 os.makedirs("data", exist_ok=True)
 os.makedirs(os.path.dirname(NOTES_PATH), exist_ok=True)
 os.makedirs(os.path.dirname(INVITE_LOG), exist_ok=True)
 
 
-def make_client() -> TelegramClient:
-    if PREFER_STRING:
-        if STRING_SESSION:
-            return TelegramClient(StringSession(STRING_SESSION), API_ID, API_HASH)
-        return TelegramClient(StringSession(), API_ID, API_HASH)
-    return TelegramClient(SESSION_FILE, API_ID, API_HASH)
+def make_client(tg: dict) -> TelegramClient:
+    api_id = int(tg.get("api_id", API_ID))
+    api_hash = tg.get("api_hash", API_HASH)
+    if bool(tg.get("prefer_string_session", PREFER_STRING)):
+        string_session = (tg.get("string_session") or "").strip()
+        if string_session:
+            return TelegramClient(StringSession(string_session), api_id, api_hash, flood_sleep_threshold=0)
+        return TelegramClient(StringSession(), api_id, api_hash, flood_sleep_threshold=0)
+    return TelegramClient(tg.get("session") or SESSION_FILE, api_id, api_hash, flood_sleep_threshold=0)
 
 
-client = make_client()
+client = make_client(CFG["telegram"])
 
-ACTIVE_INVITES = {}
-ACTIVE_INVITES_BY_CHAT = {}
-INVITE_WATCHERS = {}
 WATCH_INTERVAL = 2
+WATCH_PAGE = 100
+
+PRIO_USER = 0
+PRIO_ADMIN = 1
+PRIO_BG = 2
+SHARD_VNODES = int(RPC_CFG.get("shard_vnodes", 64))
+
+METRICS_CFG = CFG.get("metrics", {})
+METRICS_FILE = METRICS_CFG.get("file")
+METRICS_EXPORT_SEC = float(METRICS_CFG.get("export_sec", 15))
+METRICS_HTTP_HOST = METRICS_CFG.get("http_host", "127.0.0.1")
+METRICS_HTTP_PORT = int(METRICS_CFG.get("http_port", 0))
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "n")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        self.total += value
+        self.n += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return 0.0
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = METRICS_BUCKETS[i - 1] if i > 0 else 0.0
+                hi = METRICS_BUCKETS[i] if i < len(METRICS_BUCKETS) else METRICS_BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return METRICS_BUCKETS[-1]
+
+
+class Metrics:
+    LABELS = {
+        "actions_total": "action",
+        "rpc_seconds": "method",
+        "rpc_errors_total": "method",
+        "command_seconds": "cmd",
+        "command_errors_total": "cmd",
+    }
+    HELP = {
+        "actions_total": "Audit log actions by name",
+        "rpc_seconds": "Telegram RPC latency (excluding scheduler wait)",
+        "rpc_errors_total": "Telegram RPC calls that raised",
+        "command_seconds": "Admin command handling time",
+        "command_errors_total": "Admin commands that raised",
+        "audit_flush_seconds": "Audit log batch write time",
+        "audit_records_total": "Audit log records written",
+        "watch_poll_seconds": "Invite watcher poll time per peer",
+        "addv_to_dm_seconds": "Time from .addv relay to invite DM",
+        "linkv_to_dm_seconds": "Time from .linkv to invite DM",
+    }
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.hists = {}
+        self.gauges = {}
+
+    def inc(self, name: str, label: Optional[str] = None, n: int = 1):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name: str, seconds: float, label: Optional[str] = None):
+        key = (name, label)
+        h = self.hists.get(key)
+        if h is None:
+            h = self.hists[key] = Histogram()
+        h.observe(seconds)
+
+    def gauge(self, name: str, fn):
+        self.gauges[name] = fn
+
+    def _labels(self, name: str, label: Optional[str], extra: str = "") -> str:
+        parts = []
+        if label is not None:
+            parts.append('%s="%s"' % (self.LABELS.get(name, "label"), str(label).replace('"', "'")))
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _gauge_values(self) -> dict:
+        out = {}
+        for name, fn in self.gauges.items():
+            try:
+                out[name] = fn()
+            except Exception:
+                continue
+        return out
+
+    def render(self) -> str:
+        lines = []
+        typed = set()
+
+        def head(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP usher_{name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE usher_{name} {kind}")
+
+        for (name, label), v in sorted(self.counters.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+            head(name, "counter")
+            lines.append(f"usher_{name}{self._labels(name, label)} {v}")
+        for (name, label), h in sorted(self.hists.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+            head(name, "histogram")
+            cum = 0
+            for bound, c in zip(METRICS_BUCKETS + ("+Inf",), h.counts):
+                cum += c
+                le = self._labels(name, label, 'le="%s"' % bound)
+                lines.append(f"usher_{name}_bucket{le} {cum}")
+            lines.append(f"usher_{name}_sum{self._labels(name, label)} {h.total:.6f}")
+            lines.append(f"usher_{name}_count{self._labels(name, label)} {h.n}")
+        for name, v in sorted(self._gauge_values().items()):
+            head(name, "gauge")
+            lines.append(f"usher_{name} {v}")
+        head("uptime_seconds", "gauge")
+        lines.append(f"usher_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        up = int(time.time() - self.started)
+        lines = [f"Uptime {up // 3600}j {up % 3600 // 60}m"]
+        g = self._gauge_values()
+        if g:
+            lines.append("Live: " + ", ".join(f"{k}={v}" for k, v in sorted(g.items())))
+        lines.append("")
+        lines.append("Latensi (n / p50 / p99 / max-bucket):")
+        for (name, label), h in sorted(self.hists.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+            top = next((METRICS_BUCKETS[i] for i in range(len(METRICS_BUCKETS) - 1, -1, -1) if h.counts[i]), None)
+            top = f"≤{top}s" if top is not None and not h.counts[-1] else f">{METRICS_BUCKETS[-1]}s"
+            tag = f"{name}[{label}]" if label is not None else name
+            lines.append(f"  {tag}: {h.n} / {h.quantile(0.5) * 1000:.0f}ms / {h.quantile(0.99) * 1000:.0f}ms / {top}")
+        errs = [(k, v) for k, v in self.counters.items() if k[0] == "rpc_errors_total"
+                or (k[0] == "actions_total" and k[1] and k[1].endswith("_err"))]
+        if errs:
+            lines.append("")
+            lines.append("Error:")
+            for (name, label), v in sorted(errs, key=lambda kv: -kv[1])[:15]:
+                lines.append(f"  {label}: {v}")
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+
+
+def observe_job(fut: asyncio.Future, name: str, started: float):
+    def done(f: asyncio.Future):
+        if not f.cancelled() and f.exception() is None and f.result():
+            METRICS.observe(name, time.monotonic() - started)
+    fut.add_done_callback(done)
 
 
 def now_iso() -> str:
@@ -90,11 +348,141 @@ def now_iso() -> str:
 def log_action(action: str, data: dict):
     rec = {"time": now_iso(), "action": action}
     rec.update(data)
-    with open(INVITE_LOG, "a", encoding="utf-8") as f:
-        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    METRICS.inc("actions_total", action)
+    AUDIT.write(rec)
     log.info("%s | %s", action, json.dumps(data, ensure_ascii=False))
 
 
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp", "blocked_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(float(rate), 0.001)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RpcScheduler:
+    def __init__(self, cl: TelegramClient, max_inflight: int = RPC_MAX_INFLIGHT, name: str = "main"):
+        self.client = cl
+        self.name = name
+        self.max_inflight = max_inflight
+        self.floods = 0
+        self.inflight = 0
+        self.buckets = {}
+        self.waiters = []
+        self._seq = 0
+        self._timer = None
+
+    def _bucket(self, method: str) -> TokenBucket:
+        b = self.buckets.get(method)
+        if b is None:
+            b = self.buckets[method] = TokenBucket(*RPC_RATES.get(method, RPC_DEFAULT_RATE))
+        return b
+
+    def depth(self) -> int:
+        return len(self.waiters)
+
+    async def _acquire(self, method: str, prio: int):
+        b = self._bucket(method)
+        if not self.waiters and self.inflight < self.max_inflight and b.delay(time.monotonic()) == 0:
+            b.take()
+            self.inflight += 1
+            return
+        fut = asyncio.get_event_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self.waiters, (prio, self._seq, method, fut))
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.inflight -= 1
+        self._pump()
+
+    def _pump(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        blocked = []
+        wake = None
+        while self.waiters and self.inflight < self.max_inflight:
+            item = heapq.heappop(self.waiters)
+            fut = item[3]
+            if fut.done():
+                continue
+            b = self._bucket(item[2])
+            d = b.delay(now)
+            if d > 0:
+                blocked.append(item)
+                wake = d if wake is None else min(wake, d)
+                continue
+            b.take()
+            self.inflight += 1
+            fut.set_result(None)
+        for item in blocked:
+            heapq.heappush(self.waiters, item)
+        if wake is not None:
+            self._timer = asyncio.get_event_loop().call_later(wake, self._pump)
+
+    def _block(self, method: str, seconds: int):
+        b = self._bucket(method)
+        b.blocked_until = max(b.blocked_until, time.monotonic() + seconds)
+        b.tokens = 0
+
+    def blocked_for(self, method: str) -> float:
+        b = self.buckets.get(method)
+        return max(0.0, b.blocked_until - time.monotonic()) if b else 0.0
+
+    async def call(self, method: str, fn, *args, prio: int = PRIO_BG, flood_retries: Optional[int] = None, **kwargs):
+        retries = RPC_FLOOD_RETRIES if flood_retries is None else flood_retries
+        attempt = 0
+        while True:
+            await self._acquire(method, prio)
+            started = time.monotonic()
+            try:
+                return await fn(*args, **kwargs)
+            except errors.FloodWaitError as e:
+                METRICS.inc("rpc_errors_total", method)
+                attempt += 1
+                self.floods += 1
+                self._block(method, e.seconds)
+                log_action("rpc_flood_wait", {"method": method, "sec": e.seconds, "attempt": attempt, "acct": self.name})
+                if attempt > retries or e.seconds > RPC_FLOOD_MAX_WAIT:
+                    raise
+            except Exception:
+                METRICS.inc("rpc_errors_total", method)
+                raise
+            finally:
+                METRICS.observe("rpc_seconds", time.monotonic() - started, method)
+                self._release()
+
+    async def invoke(self, request, prio: int = PRIO_BG, flood_retries: Optional[int] = None):
+        return await self.call(type(request).__name__, self.client, request, prio=prio, flood_retries=flood_retries)
+
+
+RPC = RpcScheduler(client)
+
+
 def preview_text(s: str, limit: int) -> str:
     s = (s or "").strip().replace("\r", " ").replace("\n", " ")
     return s if len(s) <= limit else s[:limit - 1].rstrip() + "…"
@@ -105,22 +493,285 @@ def sanitize_title(title: str) -> str:
 
 
 def notes_media_dir(title: str) -> str:
-    return os.path.join("data", "notes_media", title)
+    return os.path.join(NOTES_MEDIA_DIR, title)
 
 
-def load_notes() -> dict:
-    if not os.path.exists(NOTES_PATH):
-        return {}
-    try:
-        with open(NOTES_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def note_blob(note: Optional[dict]) -> Optional[str]:
+    return ((note or {}).get("media") or {}).get("blob")
 
 
-def save_notes(notes: dict):
-    with open(NOTES_PATH, "w", encoding="utf-8") as f:
-        json.dump(notes, f, ensure_ascii=False, indent=2)
+def drop_legacy_media(title: str, note: Optional[dict]):
+    media = (note or {}).get("media") or {}
+    if media.get("path") and not media.get("blob"):
+        d = notes_media_dir(title)
+        if os.path.isdir(d):
+            shutil.rmtree(d)
+
+
+NOTE_TOKEN_RE = re.compile(r"\w+")
+NOTE_PREFIX_EXPAND = 200
+NOTE_FUZZY_CANDIDATES = 50
+
+
+def note_token_list(s: str) -> list:
+    return [t for t in NOTE_TOKEN_RE.findall((s or "").lower()) if len(t) > 1 or t.isdigit()]
+
+
+def note_tokens(s: str) -> set:
+    return set(note_token_list(s))
+
+
+def title_grams(s: str) -> set:
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def sorted_prefixed(items: list, prefix: str, limit: int) -> list:
+    out = []
+    i = bisect.bisect_left(items, prefix)
+    while i < len(items) and len(out) < limit and items[i].startswith(prefix):
+        out.append(items[i])
+        i += 1
+    return out
+
+
+class NoteIndex:
+    def __init__(self):
+        self.postings = {}
+        self.vocab = []
+        self.titles = []
+        self.grams = {}
+        self.terms = {}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @staticmethod
+    def _weights(title: str, note: dict) -> dict:
+        w = dict.fromkeys(note_tokens(note.get("text")), 1)
+        w.update(dict.fromkeys(note_tokens(title), 10))
+        return w
+
+    def rebuild(self, notes: dict):
+        self.postings = {}
+        self.grams = {}
+        self.terms = {}
+        for title, note in notes.items():
+            w = self.terms[title] = self._weights(title, note)
+            for tok, weight in w.items():
+                self.postings.setdefault(tok, {})[title] = weight
+            for g in title_grams(title):
+                self.grams.setdefault(g, set()).add(title)
+        self.vocab = sorted(self.postings)
+        self.titles = sorted(self.terms)
+
+    def add(self, title: str, note: dict):
+        if title in self.terms:
+            self.remove(title)
+        bisect.insort(self.titles, title)
+        w = self.terms[title] = self._weights(title, note)
+        for tok, weight in w.items():
+            posting = self.postings.get(tok)
+            if posting is None:
+                posting = self.postings[tok] = {}
+                bisect.insort(self.vocab, tok)
+            posting[title] = weight
+        for g in title_grams(title):
+            self.grams.setdefault(g, set()).add(title)
+
+    def remove(self, title: str):
+        w = self.terms.pop(title, None)
+        if w is None:
+            return
+        i = bisect.bisect_left(self.titles, title)
+        if i < len(self.titles) and self.titles[i] == title:
+            del self.titles[i]
+        for tok in w:
+            posting = self.postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(title, None)
+            if not posting:
+                del self.postings[tok]
+                j = bisect.bisect_left(self.vocab, tok)
+                if j < len(self.vocab) and self.vocab[j] == tok:
+                    del self.vocab[j]
+        for g in title_grams(title):
+            titles = self.grams.get(g)
+            if titles is not None:
+                titles.discard(title)
+                if not titles:
+                    del self.grams[g]
+
+    def _token_hits(self, tok: str, prefix: bool) -> dict:
+        hits = dict(self.postings.get(tok) or {})
+        if prefix:
+            for word in sorted_prefixed(self.vocab, tok, NOTE_PREFIX_EXPAND):
+                if word == tok:
+                    continue
+                for title, weight in self.postings[word].items():
+                    if hits.get(title, 0) < weight / 2:
+                        hits[title] = weight / 2
+        return hits
+
+    def _fuzzy(self, q: str) -> dict:
+        counts = {}
+        for g in title_grams(q):
+            for title in self.grams.get(g, ()):
+                counts[title] = counts.get(title, 0) + 1
+        best = heapq.nlargest(NOTE_FUZZY_CANDIDATES, counts, key=counts.get)
+        out = {}
+        for title in best:
+            ratio = difflib.SequenceMatcher(None, q, title).ratio()
+            if ratio >= NOTES_FUZZY_CUTOFF:
+                out[title] = ratio
+        return out
+
+    def search(self, query: str, want: int) -> list:
+        q = " ".join(query.lower().split())
+        if not q:
+            return []
+        scores = {}
+        if q in self.terms:
+            scores[q] = 1000
+        for title in sorted_prefixed(self.titles, q, NOTE_PREFIX_EXPAND):
+            scores[title] = scores.get(title, 0) + 100
+        toks = note_token_list(q)
+        if toks:
+            sets = [self._token_hits(tok, i == len(toks) - 1) for i, tok in enumerate(toks)]
+            sets.sort(key=len)
+            for title, weight in sets[0].items():
+                total = weight
+                for other in sets[1:]:
+                    w = other.get(title)
+                    if w is None:
+                        break
+                    total += w
+                else:
+                    scores[title] = scores.get(title, 0) + total
+        if len(scores) < want:
+            for title, ratio in self._fuzzy(q).items():
+                scores[title] = scores.get(title, 0) + ratio * 10
+        return sorted(scores, key=lambda t: (-scores[t], t))
+
+
+class NotesStore:
+    def __init__(self, path: str, legacy_json: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS notes (title TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "hash TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, refs INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS media_keys (key TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self.db.commit()
+        if not self.db.execute("SELECT 1 FROM meta WHERE key='json_imported'").fetchone():
+            self._import_json(legacy_json)
+        self.cache = {}
+        for title, data in self.db.execute("SELECT title, data FROM notes ORDER BY rowid"):
+            try:
+                self.cache[title] = json.loads(data)
+            except Exception:
+                log.warning("notes: skipping unreadable note %r", title)
+        self.index = NoteIndex()
+        self.index.rebuild(self.cache)
+
+    def _import_json(self, legacy_json: str):
+        notes = {}
+        if os.path.exists(legacy_json):
+            try:
+                with open(legacy_json, "r", encoding="utf-8") as f:
+                    notes = json.load(f) or {}
+            except Exception as e:
+                log.error("notes: cannot import %s, leaving it untouched: %s", legacy_json, e)
+                return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO notes (title, data) VALUES (?, ?)",
+                [(t, json.dumps(n, ensure_ascii=False)) for t, n in notes.items()]
+            )
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (now_iso(),))
+        if notes:
+            log.info("notes: imported %d notes from %s", len(notes), legacy_json)
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.cache
+
+    def get(self, title: str) -> Optional[dict]:
+        return self.cache.get(title)
+
+    def titles_page(self, offset: int, limit: int) -> list:
+        return list(itertools.islice(self.cache, offset, offset + limit))
+
+    def search(self, query: str, want: int = NOTES_FIND_MAX) -> list:
+        return self.index.search(query, want)
+
+    def put(self, title: str, note: dict):
+        old_blob = note_blob(self.cache.get(title))
+        new_blob = note_blob(note)
+        freed = []
+        with self.db:
+            self.db.execute(
+                "INSERT INTO notes (title, data) VALUES (?, ?) ON CONFLICT(title) DO UPDATE SET data=excluded.data",
+                (title, json.dumps(note, ensure_ascii=False))
+            )
+            if new_blob != old_blob:
+                if new_blob:
+                    self.db.execute("UPDATE blobs SET refs=refs+1 WHERE hash=?", (new_blob,))
+                if old_blob:
+                    freed = self._decref(old_blob)
+        self.cache[title] = note
+        self.index.add(title, note)
+        self._unlink(freed)
+
+    def delete(self, title: str) -> Optional[dict]:
+        blob = note_blob(self.cache.get(title))
+        freed = []
+        with self.db:
+            self.db.execute("DELETE FROM notes WHERE title=?", (title,))
+            if blob:
+                freed = self._decref(blob)
+        self._unlink(freed)
+        self.index.remove(title)
+        return self.cache.pop(title, None)
+
+    def blob_for_key(self, key: str) -> Optional[dict]:
+        row = self.db.execute(
+            "SELECT b.hash, b.path, b.size FROM media_keys k JOIN blobs b ON b.hash=k.hash WHERE k.key=?", (key,)
+        ).fetchone()
+        return {"hash": row[0], "path": row[1], "size": row[2]} if row else None
+
+    def register_blob(self, digest: str, path: str, size: int, key: Optional[str]):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO blobs (hash, path, size, refs) VALUES (?, ?, ?, 0)", (digest, path, size))
+            if key:
+                self.db.execute("INSERT OR REPLACE INTO media_keys (key, hash) VALUES (?, ?)", (key, digest))
+
+    def _decref(self, digest: str) -> list:
+        self.db.execute("UPDATE blobs SET refs=refs-1 WHERE hash=?", (digest,))
+        row = self.db.execute("SELECT path, refs FROM blobs WHERE hash=?", (digest,)).fetchone()
+        if not row or row[1] > 0:
+            return []
+        self.db.execute("DELETE FROM blobs WHERE hash=?", (digest,))
+        self.db.execute("DELETE FROM media_keys WHERE hash=?", (digest,))
+        return [row[0]]
+
+    @staticmethod
+    def _unlink(paths: list):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+NOTES = NotesStore(NOTES_DB_PATH, NOTES_PATH)
 
 
 def extract_int_token(tok: str) -> Optional[int]:
@@ -143,23 +794,22 @@ def clip_req(n: int) -> int:
     return n
 
 
-def addv_to_link_cmd(addv_cmd: str) -> str:
-    base = addv_cmd.lstrip("/")
-    return "link" + base[-2:]
+def is_target_token(tok: str) -> bool:
+    return tok.startswith("@") or extract_int_token(tok) is not None
 
 
-async def get_target_user_from_context(event: events.NewMessage.Event) -> Optional[int]:
+async def get_target_user_from_context(event: events.NewMessage.Event, args: list) -> Optional[int]:
     if event.is_reply:
-        r = await event.get_reply_message()
+        r = await reply_message(event)
         if r and r.sender_id and not r.is_channel:
+            if r.sender:
+                acct().resolver.remember(r.sender)
             return r.sender_id
-    parts = event.raw_text.strip().split()
-    if len(parts) >= 2:
-        tok = parts[1].strip()
+    if args:
+        tok = args[0].strip()
         if tok.startswith("@"):
             try:
-                ent = await client.get_entity(tok)
-                return getattr(ent, "id", None)
+                return await acct().resolver.user_id(tok)
             except Exception:
                 return None
         num = extract_int_token(tok)
@@ -168,9 +818,7 @@ async def get_target_user_from_context(event: events.NewMessage.Event) -> Option
     return None
 
 
-def parse_req_no_or_none(text_raw: str, consumed_first_arg: bool) -> Optional[int]:
-    parts = text_raw.strip().split()
-    args = parts[1:] if len(parts) > 1 else []
+def parse_req_no_or_none(args: list, consumed_first_arg: bool) -> Optional[int]:
     start = 1 if consumed_first_arg else 0
     while start < len(args):
         tok = args[start].strip()
@@ -206,14 +854,254 @@ async def interactive_login_and_persist_string():
     print("\n=== STRING SESSION ===\n" + s + "\n======================\n")
 
 
-async def ensure_entity_cached(peer_id: int):
-    try:
-        await client.get_entity(peer_id)
-    except Exception:
+def entity_key(key) -> str:
+    if isinstance(key, str) and key.startswith("@"):
+        return key.lower()
+    return str(int(key))
+
+
+class EntityResolver:
+    def __init__(self, cl: TelegramClient, path: str, rpc: RpcScheduler):
+        self.client = cl
+        self.rpc = rpc
+        self.mem = OrderedDict()
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, id INTEGER NOT NULL, access_hash INTEGER, updated REAL)"
+        )
+        self.db.commit()
+        self._dialogs = None
+
+    def _mem_put(self, key: str, peer):
+        self.mem[key] = (time.monotonic() + ENTITY_CACHE_TTL, peer)
+        self.mem.move_to_end(key)
+        while len(self.mem) > ENTITY_CACHE_MAX:
+            self.mem.popitem(last=False)
+
+    def _mem_get(self, key: str):
+        hit = self.mem.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            del self.mem[key]
+            return None
+        self.mem.move_to_end(key)
+        return hit[1]
+
+    @staticmethod
+    def _row_peer(kind: str, id_: int, access_hash: Optional[int]):
+        if kind == "user":
+            return types.InputPeerUser(id_, access_hash or 0)
+        if kind == "channel":
+            return types.InputPeerChannel(id_, access_hash or 0)
+        return types.InputPeerChat(id_)
+
+    def remember(self, entity, *aliases):
         try:
-            await client(functions.channels.GetChannelsRequest(id=[peer_id]))
+            peer = utils.get_input_peer(entity)
+        except Exception:
+            return None
+        if isinstance(peer, types.InputPeerUser):
+            kind, id_, ah = "user", peer.user_id, peer.access_hash
+        elif isinstance(peer, types.InputPeerChannel):
+            kind, id_, ah = "channel", peer.channel_id, peer.access_hash
+        elif isinstance(peer, types.InputPeerChat):
+            kind, id_, ah = "chat", peer.chat_id, None
+        else:
+            return peer
+        keys = {entity_key(utils.get_peer_id(peer))}
+        uname = getattr(entity, "username", None)
+        if uname:
+            keys.add("@" + uname.lower())
+        keys.update(entity_key(a) for a in aliases if a is not None)
+        now = time.time()
+        try:
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO entities (key, kind, id, access_hash, updated) VALUES (?, ?, ?, ?, ?)",
+                    [(k, kind, id_, ah, now) for k in keys]
+                )
         except Exception as e:
-            log_action("entity_cache_error", {"peer": peer_id, "err": str(e)})
+            log.warning("entity store write failed: %s", e)
+        for k in keys:
+            self._mem_put(k, peer)
+        return peer
+
+    def cached(self, key):
+        k = entity_key(key)
+        peer = self._mem_get(k)
+        if peer is not None:
+            return peer
+        row = self.db.execute("SELECT kind, id, access_hash FROM entities WHERE key=?", (k,)).fetchone()
+        if not row:
+            return None
+        peer = self._row_peer(*row)
+        self._mem_put(k, peer)
+        return peer
+
+    async def _fetch_dialogs(self):
+        dialogs = await self.rpc.call("get_dialogs", self.client.get_dialogs, limit=None, prio=PRIO_BG)
+        for d in dialogs:
+            self.remember(d.entity)
+
+    def _dialogs_done(self, fut: asyncio.Future):
+        if (fut.cancelled() or fut.exception() is not None) and self._dialogs is fut:
+            self._dialogs = None
+
+    async def _load_dialogs(self):
+        if self._dialogs is None:
+            self._dialogs = asyncio.ensure_future(self._fetch_dialogs())
+            self._dialogs.add_done_callback(self._dialogs_done)
+        await asyncio.shield(self._dialogs)
+
+    async def input_peer(self, key):
+        peer = self.cached(key)
+        if peer is not None:
+            return peer
+        try:
+            ent = await self.rpc.call("get_entity", self.client.get_entity, key, prio=PRIO_USER)
+        except Exception:
+            if isinstance(key, str):
+                raise
+            await self._load_dialogs()
+            peer = self.cached(key)
+            if peer is None:
+                raise
+            return peer
+        return self.remember(ent, key)
+
+    async def peer_or_id(self, key):
+        try:
+            return await self.input_peer(key)
+        except Exception as e:
+            log_action("entity_cache_error", {"peer": key, "err": str(e)})
+            return key
+
+    async def user_id(self, username: str) -> Optional[int]:
+        peer = await self.input_peer(username)
+        return getattr(peer, "user_id", None)
+
+    async def warm(self, keys: list):
+        keys = [k for k in keys if k is not None]
+        res = await asyncio.gather(*(self.input_peer(k) for k in keys), return_exceptions=True)
+        failed = [str(k) for k, r in zip(keys, res) if isinstance(r, Exception)]
+        log_action("entity_warm", {"ok": len(keys) - len(failed), "failed": failed})
+
+
+RESOLVER = EntityResolver(client, ENTITY_DB_PATH, RPC)
+
+
+class Account:
+    def __init__(self, name: str, cl: TelegramClient, rpc: RpcScheduler, resolver: EntityResolver):
+        self.name = name
+        self.client = cl
+        self.rpc = rpc
+        self.resolver = resolver
+        self.alive = True
+        self.bound = {}
+
+    def blocked_for(self, method: str) -> float:
+        return self.rpc.blocked_for(method)
+
+
+class AccountRing:
+    def __init__(self, names: list, vnodes: int = SHARD_VNODES):
+        self.names = list(names)
+        points = []
+        for name in self.names:
+            for i in range(vnodes):
+                points.append((self._hash(f"{name}#{i}"), name))
+        points.sort()
+        self.keys = [p[0] for p in points]
+        self.points = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def order(self, key) -> list:
+        if len(self.names) <= 1:
+            return list(self.names)
+        out = []
+        i = bisect.bisect(self.keys, self._hash(str(key)))
+        for j in range(len(self.points)):
+            name = self.points[(i + j) % len(self.points)]
+            if name not in out:
+                out.append(name)
+                if len(out) == len(self.names):
+                    break
+        return out
+
+
+def account_db_path(path: str, name: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+
+PRIMARY = Account("main", client, RPC, RESOLVER)
+ACCOUNTS = {PRIMARY.name: PRIMARY}
+for _i, _tg in enumerate(CFG["telegram"].get("accounts") or [], start=1):
+    _name = str(_tg.get("name") or f"acct{_i}")
+    _cl = make_client(_tg)
+    _rpc = RpcScheduler(_cl, name=_name)
+    ACCOUNTS[_name] = Account(_name, _cl, _rpc, EntityResolver(_cl, account_db_path(ENTITY_DB_PATH, _name), _rpc))
+RING = AccountRing(list(ACCOUNTS))
+CURRENT_ACCOUNT = contextvars.ContextVar("usher_account", default=None)
+
+
+def acct() -> Account:
+    return CURRENT_ACCOUNT.get() or PRIMARY
+
+
+async def reply(event, text: str, prio: int = PRIO_ADMIN):
+    return await acct().rpc.call("send_message", event.reply, text, prio=prio)
+
+
+async def reply_message(event):
+    return await acct().rpc.call("get_messages", event.get_reply_message, prio=PRIO_ADMIN)
+
+
+def owner_candidates(key) -> list:
+    live = [ACCOUNTS[n] for n in RING.order(key) if ACCOUNTS[n].alive]
+    return live or [PRIMARY]
+
+
+def accounts_for(key, method: str) -> list:
+    return sorted(owner_candidates(key), key=lambda a: a.blocked_for(method))
+
+
+ACCOUNT_HANDLERS = []
+
+
+def account_handler(builder):
+    def deco(fn):
+        ACCOUNT_HANDLERS.append((fn, builder))
+        return fn
+    return deco
+
+
+def bind_handler(a: Account, fn, builder):
+    old = a.bound.pop(fn, None)
+    if old is not None:
+        a.client.remove_event_handler(old)
+
+    async def bound(event):
+        token = CURRENT_ACCOUNT.set(a)
+        try:
+            await fn(event)
+        finally:
+            CURRENT_ACCOUNT.reset(token)
+    a.bound[fn] = bound
+    a.client.add_event_handler(bound, builder())
+
+
+def bind_handlers(a: Account, only=None):
+    for fn, builder in ACCOUNT_HANDLERS:
+        if only is None or fn is only:
+            bind_handler(a, fn, builder)
 
 
 def tier_peer_id(tier_key: str) -> Optional[int]:
@@ -223,7 +1111,221 @@ def tier_peer_id(tier_key: str) -> Optional[int]:
         return None
 
 
-async def create_invite(link_cmd: str, require_approval: bool = True) -> Optional[str]:
+INDEXED_SENT = ("invite_sent", "invite_sent_manual")
+INDEXED_CONSUMED = ("invite_consumed", "invite_consumed_fallback")
+INDEXED_ACTIONS = INDEXED_SENT + INDEXED_CONSUMED
+
+
+class InviteLinkIndex:
+    def __init__(self, path: str, log_path: str):
+        self.path = path
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        fresh = not os.path.exists(path)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            "link TEXT PRIMARY KEY, tier TEXT, peer INTEGER, target INTEGER, time TEXT, consumed INTEGER DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS links_target ON links(target)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+        if fresh:
+            self.rebuild()
+        else:
+            self.catch_up(self._offset())
+
+    def _offset(self) -> int:
+        row = self.db.execute("SELECT value FROM meta WHERE key='log_offset'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _set_offset(self, offset: int):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('log_offset', ?)", (str(offset),))
+
+    def _apply(self, rec: dict):
+        action = rec.get("action")
+        link = rec.get("link")
+        if not link:
+            return
+        if action in INDEXED_SENT:
+            tier = rec.get("tier")
+            self.db.execute(
+                "INSERT OR REPLACE INTO links (link, tier, peer, target, time, consumed) VALUES (?, ?, ?, ?, ?, 0)",
+                (link, tier, tier_peer_id(tier) if tier else None, rec.get("target"), rec.get("time"))
+            )
+        elif action in INDEXED_CONSUMED:
+            self.db.execute("UPDATE links SET consumed=1 WHERE link=?", (link,))
+
+    def _scan(self, f) -> int:
+        n = 0
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if rec.get("action") in INDEXED_ACTIONS:
+                self._apply(rec)
+                n += 1
+        return n
+
+    def apply_batch(self, recs: list, offset: int):
+        with self.lock:
+            try:
+                for rec in recs:
+                    if rec.get("action") in INDEXED_ACTIONS:
+                        self._apply(rec)
+                self._set_offset(offset)
+                self.db.commit()
+            except Exception as e:
+                log.warning("invite index write failed: %s", e)
+
+    def rebuild(self):
+        n = 0
+        with self.lock:
+            for seg in audit_segments(self.log_path):
+                with open_segment(seg) as f:
+                    n += self._scan(f)
+            self._set_offset(os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0)
+            self.db.commit()
+        log.info("invite index: rebuilt %d records from %s", n, self.log_path)
+
+    def catch_up(self, offset: int):
+        if not os.path.exists(self.log_path):
+            return
+        size = os.path.getsize(self.log_path)
+        if offset > size:
+            offset = 0
+        if offset == size:
+            return
+        with self.lock:
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                n = self._scan(f)
+                self._set_offset(f.tell())
+            self.db.commit()
+        log.info("invite index: %d records indexed from %s (offset %d)", n, self.log_path, offset)
+
+    def latest_for_target(self, target: int, peer: Optional[int] = None) -> Optional[dict]:
+        with self.lock:
+            if peer is None:
+                row = self.db.execute(
+                    "SELECT link, tier, peer, target, consumed FROM links WHERE target=? ORDER BY rowid DESC LIMIT 1",
+                    (target,)
+                ).fetchone()
+            else:
+                row = self.db.execute(
+                    "SELECT link, tier, peer, target, consumed FROM links WHERE target=? AND peer=? "
+                    "ORDER BY rowid DESC LIMIT 1",
+                    (target, peer)
+                ).fetchone()
+        return self._row(row)
+
+    @staticmethod
+    def _row(row) -> Optional[dict]:
+        if not row:
+            return None
+        return {"link": row[0], "tier": row[1], "peer": row[2], "target": row[3], "consumed": bool(row[4])}
+
+
+INVITE_INDEX = InviteLinkIndex(INVITE_INDEX_PATH, INVITE_LOG)
+
+
+class AuditLogWriter:
+    _STOP = object()
+
+    def __init__(self, path: str, index: InviteLinkIndex):
+        self.path = path
+        self.index = index
+        self.q = queue.Queue()
+        self._day = self._file_day()
+        self.thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self.thread.start()
+
+    def write(self, rec: dict):
+        self.q.put(rec)
+
+    def close(self, timeout: float = 10.0):
+        if self.thread.is_alive():
+            self.q.put(self._STOP)
+            self.thread.join(timeout)
+
+    def _file_day(self) -> Optional[str]:
+        try:
+            return time.strftime("%Y%m%d", time.localtime(os.path.getmtime(self.path)))
+        except OSError:
+            return None
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self.q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + LOG_FLUSH_SEC
+                batch.append(item)
+                if len(batch) < LOG_BATCH_MAX:
+                    continue
+            self._flush(batch)
+            batch = []
+
+    def _flush(self, batch: list):
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            self._maybe_rotate()
+            data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+                offset = f.tell()
+            self._day = time.strftime("%Y%m%d")
+        except Exception as e:
+            log.error("audit log write failed (%d records): %s", len(batch), e)
+            return
+        METRICS.observe("audit_flush_seconds", time.monotonic() - started)
+        METRICS.inc("audit_records_total", n=len(batch))
+        self.index.apply_batch(batch, offset)
+
+    def _maybe_rotate(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size == 0:
+            return
+        new_day = LOG_ROTATE_DAILY and self._day and self._day != time.strftime("%Y%m%d")
+        if size < LOG_ROTATE_BYTES and not new_day:
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        seg = f"{self.path}.{stamp}"
+        n = 0
+        while os.path.exists(seg) or os.path.exists(seg + ".gz"):
+            n += 1
+            seg = f"{self.path}.{stamp}-{n}"
+        os.replace(self.path, seg)
+        try:
+            with open(seg, "rb") as src, gzip.open(seg + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(seg)
+        except Exception as e:
+            log.error("audit log compress failed for %s: %s", seg, e)
+
+
+AUDIT = AuditLogWriter(INVITE_LOG, INVITE_INDEX)
+atexit.register(AUDIT.close)
+
+
+async def create_invite(link_cmd: str, require_approval: bool = True, prio: int = PRIO_USER) -> Optional[str]:
     peer_cfg = VIP_MAP.get(link_cmd)
     if not peer_cfg:
         log_action("invite_error", {"tier": link_cmd, "err": "peer_not_configured"})
@@ -231,27 +1333,42 @@ async def create_invite(link_cmd: str, require_approval: bool = True) -> Optiona
     try:
         peer_id = int(str(peer_cfg).strip())
         expire = int(time.time()) + TTL
-        await ensure_entity_cached(peer_id)
-        kwargs = dict(peer=peer_id, expire_date=expire, request_needed=require_approval)
-        if not require_approval:
-            kwargs["usage_limit"] = LIMIT
-        res = await client(functions.messages.ExportChatInviteRequest(**kwargs))
-        link = getattr(res, "link", None)
-        if not link and hasattr(res, "exported_invite"):
-            link = getattr(res.exported_invite, "link", None)
-        if not link:
-            log_action("invite_error", {"tier": link_cmd, "peer": str(peer_cfg), "err": "no_link_returned"})
-            return None
-        return link
+        candidates = accounts_for(peer_id, "ExportChatInviteRequest")
+        for i, a in enumerate(candidates):
+            last = i == len(candidates) - 1
+            peer = await a.resolver.peer_or_id(peer_id)
+            kwargs = dict(peer=peer, expire_date=expire, request_needed=require_approval)
+            if not require_approval:
+                kwargs["usage_limit"] = LIMIT
+            try:
+                res = await a.rpc.invoke(
+                    functions.messages.ExportChatInviteRequest(**kwargs), prio, flood_retries=None if last else 0
+                )
+            except errors.FloodWaitError as e:
+                if last:
+                    raise
+                log_action("invite_failover", {"tier": link_cmd, "acct": a.name, "sec": e.seconds})
+                continue
+            link = getattr(res, "link", None)
+            if not link and hasattr(res, "exported_invite"):
+                link = getattr(res.exported_invite, "link", None)
+            if not link:
+                log_action("invite_error", {"tier": link_cmd, "peer": str(peer_cfg), "err": "no_link_returned"})
+                return None
+            set_link_owner(link, a, expire)
+            return link
     except Exception as e:
         log_action("invite_error", {"tier": link_cmd, "peer": str(peer_cfg), "err": str(e)})
         return None
 
 
-async def revoke_invite(peer_key: str, link: str):
+async def revoke_invite(peer_key: str, link: str, peer_id: Optional[int] = None):
     try:
-        peer_id = int(str(VIP_MAP[peer_key]).strip())
-        await client(functions.messages.EditExportedChatInviteRequest(peer=peer_id, link=link, revoked=True))
+        if peer_id is None:
+            peer_id = int(str(VIP_MAP[peer_key]).strip())
+        a = link_account(link, peer_id)
+        peer = await a.resolver.peer_or_id(peer_id)
+        await a.rpc.invoke(functions.messages.EditExportedChatInviteRequest(peer=peer, link=link, revoked=True), PRIO_ADMIN)
         log_action("invite_revoked", {"tier": peer_key, "link": link})
     except Exception as e:
         log_action("revoke_err", {"tier": peer_key, "err": str(e)})
@@ -259,49 +1376,658 @@ async def revoke_invite(peer_key: str, link: str):
 
 async def decline_all_pending(peer_id: int, link: str):
     try:
-        await client(functions.messages.HideAllChatJoinRequests(peer=peer_id, link=link, approved=False))
+        a = link_account(link, peer_id)
+        peer = await a.resolver.peer_or_id(peer_id)
+        await a.rpc.invoke(functions.messages.HideAllChatJoinRequestsRequest(peer=peer, link=link, approved=False), PRIO_ADMIN)
         log_action("pending_declined", {"peer": peer_id, "link": link})
     except Exception as e:
         log_action("pending_decline_err", {"peer": peer_id, "link": link, "err": str(e)})
 
 
-async def get_request_count(peer_id: int, link: str) -> int:
-    try:
-        res = await client(functions.messages.GetChatInviteImportersRequest(
-            peer=peer_id,
-            link=link,
-            offset_date=0,
-            offset_user=types.InputUserEmpty(),
-            limit=1,
-            requested=True
-        ))
-        return getattr(res, "count", 0) or 0
-    except Exception as e:
-        log_action("importers_err", {"peer": peer_id, "link": link, "err": str(e)})
-        return 0
+def watch_base_interval() -> float:
+    return WATCH_RECONCILE if JOIN_REQ_MODE == "push" else WATCH_INTERVAL
 
 
-async def watch_and_revoke_on_first_request(tier_key: str, peer_id: int, link: str, target_id: Optional[int]):
-    key = (peer_id, link)
-    if key in INVITE_WATCHERS:
-        return
-    INVITE_WATCHERS[key] = True
-    try:
+def watch_interval(age: float) -> float:
+    base = watch_base_interval()
+    steps = int(age // WATCH_BACKOFF_AFTER) if WATCH_BACKOFF_AFTER > 0 else 0
+    return min(max(WATCH_INTERVAL_MAX, base), base * (2 ** min(steps, 16)))
+
+
+class WatchEntry:
+    __slots__ = ("tier", "peer", "link", "target", "started", "expire", "due")
+
+    def __init__(self, tier: str, peer: int, link: str, target: Optional[int], started: float, expire: float):
+        self.tier = tier
+        self.peer = peer
+        self.link = link
+        self.target = target
+        self.started = started
+        self.expire = expire
+        self.due = started + watch_base_interval()
+
+
+class InviteWatchScheduler:
+    def __init__(self):
+        self.by_peer = {}
+        self.peer_due = {}
+        self._wake = None
+        self._task = None
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self.by_peer.values())
+
+    def __contains__(self, key) -> bool:
+        peer, link = key
+        return link in self.by_peer.get(peer, {})
+
+    def add(self, tier: str, peer: int, link: str, target: Optional[int],
+            started: Optional[float] = None, expire: Optional[float] = None):
+        links = self.by_peer.setdefault(peer, {})
+        if link in links:
+            return
+        started = time.time() if started is None else started
+        e = WatchEntry(tier, peer, link, target, started, started + TTL if expire is None else expire)
+        links[link] = e
+        if e.due < self.peer_due.get(peer, float("inf")):
+            self.peer_due[peer] = e.due
+        self.start()
+        self._wake.set()
+
+    def add_many(self, items: list):
+        now = time.time()
+        for tier, peer, link, target, started, expire in items:
+            links = self.by_peer.setdefault(peer, {})
+            if link in links:
+                continue
+            e = WatchEntry(tier, peer, link, target, started, expire)
+            e.due = now + watch_base_interval()
+            links[link] = e
+            self.peer_due[peer] = min(self.peer_due.get(peer, float("inf")), e.due)
+        if items:
+            self.start()
+            self._wake.set()
+
+    def discard(self, peer: int, link: str):
+        links = self.by_peer.get(peer)
+        if links is None:
+            return
+        links.pop(link, None)
+        if not links:
+            self._drop_peer(peer)
+
+    def _drop_peer(self, peer: int):
+        self.by_peer.pop(peer, None)
+        self.peer_due.pop(peer, None)
+
+    def poke(self, peer: int):
+        if peer in self.by_peer:
+            self.peer_due[peer] = time.time()
+            self.start()
+            self._wake.set()
+
+    def fire(self, peer: int, link: str, cnt: int, source: str) -> bool:
+        e = self.by_peer.get(peer, {}).get(link)
+        if e is None:
+            return False
+        self.discard(peer, link)
+        asyncio.create_task(self._revoke(e, cnt, source))
+        return True
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def _earliest(self):
+        if not self.peer_due:
+            return None, None
+        peer = min(self.peer_due, key=self.peer_due.get)
+        return peer, self.peer_due[peer]
+
+    async def _run(self):
         while True:
-            await asyncio.sleep(WATCH_INTERVAL)
-            cnt = await get_request_count(peer_id, link)
+            self._wake.clear()
+            peer, due = self._earliest()
+            if peer is None:
+                await self._wake.wait()
+                continue
+            delay = due - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            started = time.monotonic()
+            try:
+                await self._poll(peer)
+            except Exception as e:
+                log_action("watch_err", {"peer": peer, "err": str(e)})
+                self.peer_due[peer] = time.time() + WATCH_INTERVAL_MAX
+            METRICS.observe("watch_poll_seconds", time.monotonic() - started)
+
+    async def _fetch_counts(self, peer_id: int, links, a: Account) -> Optional[dict]:
+        want = set(links)
+        found = {}
+        offset_date = None
+        offset_link = None
+        try:
+            peer = await a.resolver.peer_or_id(peer_id)
+            while want:
+                res = await a.rpc.invoke(functions.messages.GetExportedChatInvitesRequest(
+                    peer=peer,
+                    admin_id=types.InputUserSelf(),
+                    limit=WATCH_PAGE,
+                    revoked=False,
+                    offset_date=offset_date,
+                    offset_link=offset_link
+                ), PRIO_BG)
+                invites = getattr(res, "invites", None) or []
+                for inv in invites:
+                    link = getattr(inv, "link", None)
+                    if link in want:
+                        found[link] = getattr(inv, "requested", 0) or 0
+                        want.discard(link)
+                if len(invites) < WATCH_PAGE:
+                    break
+                offset_date, offset_link = invites[-1].date, invites[-1].link
+        except Exception as e:
+            log_action("importers_err", {"peer": peer_id, "links": len(links), "acct": a.name, "err": str(e)})
+            return None
+        return found
+
+    async def _poll(self, peer: int):
+        links = self.by_peer.get(peer)
+        now = time.time()
+        for link, e in list((links or {}).items()):
+            if e.expire <= now:
+                links.pop(link, None)
+        if not links:
+            self._drop_peer(peer)
+            return
+        polled = dict(links)
+        groups = {}
+        for link in polled:
+            groups.setdefault(link_account(link, peer), []).append(link)
+        results = await asyncio.gather(*(self._fetch_counts(peer, ls, a) for a, ls in groups.items()))
+        counts = {}
+        unknown = set()
+        for ls, res in zip(groups.values(), results):
+            if res is None:
+                unknown.update(ls)
+            else:
+                counts.update(res)
+        links = self.by_peer.get(peer)
+        if not links:
+            return
+        now = time.time()
+        next_due = float("inf")
+        for link, e in list(links.items()):
+            if polled.get(link) is not e:
+                e.due = now + watch_base_interval()
+                next_due = min(next_due, e.due)
+                continue
+            if link in unknown:
+                e.due = now + WATCH_INTERVAL_MAX
+                next_due = min(next_due, e.due)
+                continue
+            cnt = counts.get(link)
+            if cnt is None:
+                links.pop(link, None)
+                continue
             if cnt >= 1:
+                links.pop(link, None)
+                asyncio.create_task(self._revoke(e, cnt, "poll"))
+                continue
+            e.due = now + watch_interval(now - e.started)
+            next_due = min(next_due, e.due)
+        if links:
+            self.peer_due[peer] = next_due
+        else:
+            self._drop_peer(peer)
+
+    async def _revoke(self, e: WatchEntry, cnt: int, source: str):
+        try:
+            await revoke_invite(e.tier, e.link, e.peer)
+            await decline_all_pending(e.peer, e.link)
+            log_action("invite_revoked_on_request", {
+                "tier": e.tier, "peer": e.peer, "link": e.link, "req_count": cnt, "target": e.target, "via": source
+            })
+        except Exception as ex:
+            log_action("revoke_on_request_err", {"tier": e.tier, "peer": e.peer, "link": e.link, "err": str(ex)})
+
+
+WATCHER = InviteWatchScheduler()
+
+
+def watch_and_revoke_on_first_request(tier_key: str, peer_id: int, link: str, target_id: Optional[int],
+                                      expire: Optional[float] = None):
+    WATCHER.add(tier_key, peer_id, link, target_id, expire=expire)
+
+
+class InviteRecord:
+    __slots__ = ("tier", "peer", "link", "target", "expire")
+
+    def __init__(self, tier: str, peer: Optional[int], link: str, target: int, expire: float):
+        self.tier = tier
+        self.peer = peer
+        self.link = link
+        self.target = target
+        self.expire = expire
+
+
+class InviteStateStore:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS invites ("
+            "link TEXT PRIMARY KEY, tier TEXT, peer INTEGER, target INTEGER, expire REAL)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS pool (link TEXT PRIMARY KEY, tier TEXT, created REAL, expire REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS link_owner (link TEXT PRIMARY KEY, acct TEXT, expire REAL)")
+        self.db.commit()
+
+    def put(self, rec: InviteRecord):
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO invites (link, tier, peer, target, expire) VALUES (?, ?, ?, ?, ?)",
+                (rec.link, rec.tier, rec.peer, rec.target, rec.expire)
+            )
+            self.db.commit()
+        except Exception as e:
+            log.warning("invite state write failed: %s", e)
+
+    def delete(self, links: list):
+        try:
+            self.db.executemany("DELETE FROM invites WHERE link=?", [(l,) for l in links])
+            self.db.commit()
+        except Exception as e:
+            log.warning("invite state delete failed: %s", e)
+
+    def load(self) -> list:
+        rows = self.db.execute("SELECT tier, peer, link, target, expire FROM invites ORDER BY rowid").fetchall()
+        return [InviteRecord(*row) for row in rows]
+
+    def pool_put(self, tier: str, pl: "PooledLink"):
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pool (link, tier, created, expire) VALUES (?, ?, ?, ?)",
+                (pl.link, tier, pl.created, pl.expire)
+            )
+            self.db.commit()
+        except Exception as e:
+            log.warning("invite pool write failed: %s", e)
+
+    def pool_delete(self, links: list):
+        try:
+            self.db.executemany("DELETE FROM pool WHERE link=?", [(l,) for l in links])
+            self.db.commit()
+        except Exception as e:
+            log.warning("invite pool delete failed: %s", e)
+
+    def owner_put(self, link: str, name: str, expire: float):
+        try:
+            self.db.execute("INSERT OR REPLACE INTO link_owner (link, acct, expire) VALUES (?, ?, ?)", (link, name, expire))
+            self.db.commit()
+        except Exception as e:
+            log.warning("link owner write failed: %s", e)
+
+    def owner_prune(self, now: float):
+        try:
+            self.db.execute("DELETE FROM link_owner WHERE expire <= ?", (now,))
+            self.db.commit()
+        except Exception as e:
+            log.warning("link owner prune failed: %s", e)
+
+    def owner_load(self) -> dict:
+        return {link: (name, expire) for link, name, expire in self.db.execute("SELECT link, acct, expire FROM link_owner")}
+
+    def pool_load(self) -> list:
+        rows = self.db.execute("SELECT tier, link, created, expire FROM pool ORDER BY created").fetchall()
+        return [(tier, PooledLink(link, created, expire)) for tier, link, created, expire in rows]
+
+
+class InviteExpirySweeper:
+    def __init__(self):
+        self.heap = []
+        self._seq = 0
+        self._wake = None
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def schedule(self, rec: InviteRecord):
+        self._seq += 1
+        heapq.heappush(self.heap, (rec.expire, self._seq, rec))
+        if len(self.heap) > 2 * len(INVITES) + 64:
+            self._compact()
+        self.start()
+        if self.heap[0][2] is rec:
+            self._wake.set()
+
+    def _compact(self):
+        self.heap = [item for item in self.heap if INVITES.get_link(item[2].link) is item[2]]
+        heapq.heapify(self.heap)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            if not self.heap:
+                await self._wake.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
                 try:
-                    await revoke_invite(tier_key, link)
-                    await decline_all_pending(peer_id, link)
-                    log_action("invite_revoked_on_request", {
-                        "tier": tier_key, "peer": peer_id, "link": link, "req_count": cnt, "target": target_id
-                    })
-                except Exception as e:
-                    log_action("revoke_on_request_err", {"tier": tier_key, "peer": peer_id, "link": link, "err": str(e)})
-                break
-    finally:
-        INVITE_WATCHERS.pop(key, None)
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._sweep(time.time())
+
+    def _sweep(self, now: float):
+        while self.heap and self.heap[0][0] <= now:
+            _, _, rec = heapq.heappop(self.heap)
+            if INVITES.get_link(rec.link) is not rec:
+                continue
+            INVITES.revoke(rec.link)
+            log_action("invite_expired", {
+                "tier": rec.tier, "peer": rec.peer, "link": rec.link, "target": rec.target, "revoke": EXPIRE_REVOKE
+            })
+            if EXPIRE_REVOKE and rec.peer:
+                asyncio.create_task(revoke_invite(rec.tier, rec.link, rec.peer))
+
+
+EXPIRY = InviteExpirySweeper()
+
+
+class InviteRegistry:
+    def __init__(self, store: Optional[InviteStateStore] = None):
+        self.store = store
+        self.by_target = {}
+        self.by_link = {}
+        self.by_peer = {}
+
+    def __len__(self) -> int:
+        return len(self.by_link)
+
+    def get(self, target: int) -> Optional[InviteRecord]:
+        return self.by_target.get(target)
+
+    def get_link(self, link: str) -> Optional[InviteRecord]:
+        return self.by_link.get(link)
+
+    def peer_links(self, peer: int) -> dict:
+        return self.by_peer.get(peer) or {}
+
+    def latest_for_peer(self, peer: int) -> Optional[InviteRecord]:
+        links = self.by_peer.get(peer)
+        if not links:
+            return None
+        return next(reversed(links.values()))
+
+    def add(self, rec: InviteRecord, persist: bool = True) -> Optional[InviteRecord]:
+        old = self.by_target.get(rec.target)
+        if old is not None:
+            self._unindex(old)
+        prev = self.by_link.get(rec.link)
+        if prev is not None:
+            self._unindex(prev)
+        self.by_target[rec.target] = rec
+        self.by_link[rec.link] = rec
+        if rec.peer:
+            self.by_peer.setdefault(rec.peer, {})[rec.link] = rec
+        if persist and self.store:
+            self.store.put(rec)
+        EXPIRY.schedule(rec)
+        return old
+
+    def consume(self, target: int) -> Optional[InviteRecord]:
+        rec = self.by_target.get(target)
+        if rec is not None:
+            self._unindex(rec)
+        return rec
+
+    def revoke(self, link: str) -> Optional[InviteRecord]:
+        rec = self.by_link.get(link)
+        if rec is not None:
+            self._unindex(rec)
+        return rec
+
+    def _unindex(self, rec: InviteRecord):
+        if self.by_target.get(rec.target) is rec:
+            del self.by_target[rec.target]
+        if self.by_link.get(rec.link) is rec:
+            del self.by_link[rec.link]
+        if rec.peer:
+            links = self.by_peer.get(rec.peer)
+            if links is not None and links.get(rec.link) is rec:
+                del links[rec.link]
+                if not links:
+                    del self.by_peer[rec.peer]
+            WATCHER.discard(rec.peer, rec.link)
+        if self.store:
+            self.store.delete([rec.link])
+
+
+INVITES = InviteRegistry(InviteStateStore(INVITE_STATE_PATH))
+LINK_OWNER = {}
+
+
+def set_link_owner(link: str, a: Account, expire: float):
+    if len(ACCOUNTS) == 1:
+        return
+    LINK_OWNER[link] = (a.name, expire)
+    INVITES.store.owner_put(link, a.name, expire)
+    if len(LINK_OWNER) > 2 * (len(INVITES) + POOL.size()) + 1024:
+        prune_link_owners()
+
+
+def prune_link_owners():
+    now = time.time()
+    for link in [l for l, (_, exp) in LINK_OWNER.items() if exp <= now]:
+        del LINK_OWNER[link]
+    INVITES.store.owner_prune(now)
+
+
+def link_account(link: str, peer_id: Optional[int] = None) -> Account:
+    owner = LINK_OWNER.get(link)
+    a = ACCOUNTS.get(owner[0]) if owner else None
+    if a is not None:
+        return a
+    return owner_candidates(peer_id)[0] if peer_id else PRIMARY
+
+
+def restore_invites():
+    now = time.time()
+    if len(ACCOUNTS) > 1:
+        LINK_OWNER.update(INVITES.store.owner_load())
+        prune_link_owners()
+    live, expired = [], []
+    for rec in INVITES.store.load():
+        (live if rec.expire > now else expired).append(rec)
+    if expired:
+        INVITES.store.delete([r.link for r in expired])
+    for rec in live:
+        INVITES.add(rec, persist=False)
+    WATCHER.add_many([(r.tier, r.peer, r.link, r.target, r.expire - TTL, r.expire) for r in live if r.peer])
+    log_action("invites_restored", {"live": len(live), "expired": len(expired), "watched": len(WATCHER)})
+
+
+async def revoke_old_invite_for_target(target: int):
+    old = INVITES.get(target)
+    if not old or not old.peer:
+        return
+    try:
+        await revoke_invite(old.tier, old.link, old.peer)
+        INVITES.revoke(old.link)
+        log_action("invite_revoked_old_for_target", {"tier": old.tier, "target": target, "link": old.link})
+    except Exception as e:
+        log_action("revoke_old_err", {"tier": old.tier, "target": target, "err": str(e)})
+
+
+def register_invite(tier: str, target: int, link: str, expire: Optional[float] = None) -> InviteRecord:
+    peer_id = tier_peer_id(tier)
+    rec = InviteRecord(tier, peer_id, link, target, time.time() + TTL if expire is None else expire)
+    INVITES.add(rec)
+    if peer_id:
+        watch_and_revoke_on_first_request(tier, peer_id, link, target, rec.expire)
+    return rec
+
+
+def pool_depth(tier: str) -> int:
+    if isinstance(POOL_DEPTH, dict):
+        return int(POOL_DEPTH.get(tier, 0))
+    return int(POOL_DEPTH or 0)
+
+
+class PooledLink:
+    __slots__ = ("link", "created", "expire")
+
+    def __init__(self, link: str, created: float, expire: float):
+        self.link = link
+        self.created = created
+        self.expire = expire
+
+
+class InvitePool:
+    def __init__(self, store: InviteStateStore):
+        self.store = store
+        self.links = {}
+        self._task = None
+        self._wake = None
+
+    def size(self, tier: Optional[str] = None) -> int:
+        if tier is not None:
+            return len(self.links.get(tier, ()))
+        return sum(len(dq) for dq in self.links.values())
+
+    def take(self, tier: str) -> Optional[PooledLink]:
+        dq = self.links.get(tier)
+        now = time.time()
+        while dq:
+            pl = dq.popleft()
+            if now - pl.created < POOL_MAX_AGE:
+                self.store.pool_delete([pl.link])
+                self._poke()
+                return pl
+            dq.appendleft(pl)
+            break
+        self._poke()
+        return None
+
+    def restore(self):
+        now = time.time()
+        for tier, pl in self.store.pool_load():
+            self.links.setdefault(tier, deque()).append(pl)
+        log_action("invite_pool_restored", {"links": self.size(), "stale": sum(
+            1 for dq in self.links.values() for pl in dq if now - pl.created >= POOL_MAX_AGE
+        )})
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    def _poke(self):
+        if self._wake:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await self._tick()
+            except Exception as e:
+                log_action("invite_pool_err", {"err": str(e)})
+            oldest = [dq[0].created for dq in self.links.values() if dq]
+            delay = POOL_REFILL_SEC
+            if oldest:
+                delay = max(1.0, min(delay, min(oldest) + POOL_MAX_AGE - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _retire(self, items: list, reason: str, peers: Optional[dict] = None):
+        if not items:
+            return
+        peers = peers or {}
+        self.store.pool_delete([pl.link for _, pl in items])
+        await asyncio.gather(*(revoke_invite(tier, pl.link, peers.get(tier)) for tier, pl in items))
+        log_action("invite_pool_retired", {"count": len(items), "reason": reason})
+
+    async def drop_tiers(self, peers: dict):
+        items = [(tier, pl) for tier in peers for pl in self.links.pop(tier, ())]
+        await self._retire(items, "config_reload", peers)
+
+    async def _tick(self):
+        now = time.time()
+        stale = []
+        for tier, dq in self.links.items():
+            while dq and now - dq[0].created >= POOL_MAX_AGE:
+                stale.append((tier, dq.popleft()))
+        await self._retire(stale, "max_age")
+        for tier in list(VIP_MAP):
+            want = pool_depth(tier)
+            dq = self.links.setdefault(tier, deque())
+            while len(dq) < want:
+                created = time.time()
+                link = await create_invite(tier, True, prio=PRIO_BG)
+                if not link:
+                    break
+                pl = PooledLink(link, created, created + TTL)
+                dq.append(pl)
+                self.store.pool_put(tier, pl)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        items = [(tier, pl) for tier, dq in self.links.items() for pl in dq]
+        self.links = {}
+        await self._retire(items, "shutdown")
+
+
+POOL = InvitePool(INVITES.store)
+
+
+async def obtain_invite(tier: str) -> Optional[tuple]:
+    pl = POOL.take(tier)
+    if pl:
+        return pl.link, pl.expire
+    link = await create_invite(tier, True)
+    return (link, None) if link else None
 
 
 async def send_invite_to_user(user_id: int, tier: str, link: str):
@@ -314,11 +2040,176 @@ async def send_invite_to_user(user_id: int, tier: str, link: str):
         n = ""
     tier_label = f"VIP{n}" if n.isdigit() else "VIP"
     msg = INVITE_TPL.format(tier=tier_label, link=link)
-    await client.send_message(user_id, msg, silent=SILENT_DM)
+    a = acct()
+    peer = a.resolver.cached(user_id) or user_id
+    await a.rpc.call("send_message", a.client.send_message, peer, msg, silent=SILENT_DM, prio=PRIO_USER)
+
+
+FILE_REF_ERRORS = (
+    errors.FileReferenceExpiredError,
+    errors.FileReferenceInvalidError,
+    errors.FileReferenceEmptyError,
+    errors.MediaEmptyError,
+)
+
+
+def media_ref(media) -> Optional[dict]:
+    if isinstance(media, types.Photo):
+        kind = "photo"
+    elif isinstance(media, types.Document):
+        kind = "document"
+    else:
+        return None
+    return {
+        "kind": kind,
+        "id": media.id,
+        "access_hash": media.access_hash,
+        "file_reference": base64.b64encode(media.file_reference or b"").decode("ascii"),
+    }
+
+
+def input_media_from_ref(ref: dict):
+    fr = base64.b64decode(ref.get("file_reference") or "")
+    if ref.get("kind") == "photo":
+        return types.InputPhoto(id=ref["id"], access_hash=ref["access_hash"], file_reference=fr)
+    return types.InputDocument(id=ref["id"], access_hash=ref["access_hash"], file_reference=fr)
+
+
+def note_ref_slot(media: dict, a: Account) -> dict:
+    if a is PRIMARY:
+        return media
+    return media.setdefault("refs", {}).setdefault(a.name, {})
+
+
+async def refresh_note_ref(title: str, note: dict) -> Optional[dict]:
+    a = acct()
+    slot = note_ref_slot(note.get("media") or {}, a)
+    src = slot.get("src")
+    if not src:
+        return None
+    try:
+        m = await a.rpc.call("get_messages", a.client.get_messages, src["chat"], ids=src["msg"], prio=PRIO_ADMIN)
+    except Exception as e:
+        log_action("note_ref_refresh_err", {"title": title, "err": str(e)})
+        return None
+    ref = media_ref(m.photo or m.document) if m else None
+    old = slot.get("ref") or {}
+    if ref and ref["id"] == old.get("id", ref["id"]):
+        slot["ref"] = ref
+        NOTES.put(title, note)
+        return ref
+    return None
+
+
+async def send_note(target_id: int, title: str, note: dict, prio: int = PRIO_ADMIN):
+    a = acct()
+    caption = note.get("text", "") or ""
+    if note["type"] == "text":
+        await a.rpc.call("send_message", a.client.send_message, target_id, caption, prio=prio)
+        return
+    media = note.get("media") or {}
+    slot = note_ref_slot(media, a)
+    ref = slot.get("ref")
+    if ref:
+        try:
+            await a.rpc.call("send_message", a.client.send_file, target_id, input_media_from_ref(ref), caption=caption, prio=prio)
+            return
+        except FILE_REF_ERRORS:
+            ref = await refresh_note_ref(title, note)
+        if ref:
+            try:
+                await a.rpc.call("send_message", a.client.send_file, target_id, input_media_from_ref(ref), caption=caption, prio=prio)
+                return
+            except FILE_REF_ERRORS:
+                pass
+        log_action("note_ref_expired", {"title": title, "acct": a.name})
+    path = media.get("path")
+    if not (path and os.path.exists(path)):
+        await a.rpc.call("send_message", a.client.send_message, target_id, caption, prio=prio)
+        return
+    attrs = [types.DocumentAttributeFilename(media["name"])] if note["type"] == "document" and media.get("name") else None
+    msg = await a.rpc.call(
+        "send_message", a.client.send_file, target_id, path,
+        caption=caption, force_document=(note["type"] == "document"), attributes=attrs, prio=prio
+    )
+    ref = media_ref(getattr(msg, "photo", None) or getattr(msg, "document", None))
+    if ref:
+        slot["ref"] = ref
+        slot["src"] = {"chat": msg.chat_id, "msg": msg.id}
+        note["media"] = media
+        NOTES.put(title, note)
+
+
+def note_handle_ready(note: dict, a: Account) -> bool:
+    if note["type"] == "text":
+        return True
+    media = note.get("media") or {}
+    return bool(note_ref_slot(media, a).get("ref")) or not (media.get("path") and os.path.exists(media["path"]))
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def media_size(media) -> Optional[int]:
+    if isinstance(media, types.Document):
+        return media.size
+    if isinstance(media, types.Photo) and media.sizes:
+        s = media.sizes[-1]
+        return getattr(s, "size", None) or max(getattr(s, "sizes", None) or [0]) or None
+    return None
+
+
+async def store_note_media(media) -> dict:
+    ref = media_ref(media)
+    key = f"{ref['kind']}:{ref['id']}" if ref else None
+    blob = NOTES.blob_for_key(key) if key else None
+    if blob and os.path.exists(blob["path"]):
+        return {"blob": blob["hash"], "path": blob["path"], "size": blob["size"]}
+    size = media_size(media)
+    if NOTES_MEDIA_MAX and size and size > NOTES_MEDIA_MAX:
+        raise MediaTooLarge(size)
+    os.makedirs(NOTES_BLOB_DIR, exist_ok=True)
+    tmp = os.path.join(NOTES_BLOB_DIR, f".tmp-{os.getpid()}-{time.monotonic_ns()}")
+    h = hashlib.sha256()
+    n = 0
+    a = acct()
+    chunks = a.client.iter_download(media).__aiter__()
+
+    async def next_chunk():
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    try:
+        with open(tmp, "wb") as f:
+            while True:
+                chunk = await a.rpc.call("iter_download", next_chunk, prio=PRIO_ADMIN)
+                if chunk is None:
+                    break
+                n += len(chunk)
+                if NOTES_MEDIA_MAX and n > NOTES_MEDIA_MAX:
+                    raise MediaTooLarge(n)
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        path = os.path.join(NOTES_BLOB_DIR, digest[:2], digest + utils.get_extension(media))
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    NOTES.register_blob(digest, path, n, key)
+    return {"blob": digest, "path": path, "size": n}
 
 
 async def capture_note_from_reply(event, title: str, caption_override: Optional[str]) -> Optional[dict]:
-    r = await event.get_reply_message()
+    r = await reply_message(event)
     if not r:
         return None
     media = None
@@ -334,266 +2225,1229 @@ async def capture_note_from_reply(event, title: str, caption_override: Optional[
         media = r.video
         media_type = "video"
     if media:
-        d = notes_media_dir(title)
-        if os.path.exists(d):
-            shutil.rmtree(d)
-        os.makedirs(d, exist_ok=True)
-        path = await client.download_media(media, file=d)
-        size = os.path.getsize(path) if os.path.exists(path) else None
-        return {"type": media_type, "text": caption_text, "media": {"path": path, "size": size}}
+        m = await store_note_media(media)
+        slot = note_ref_slot(m, acct())
+        slot["src"] = {"chat": r.chat_id, "msg": r.id}
+        if media_type == "document" and r.file and r.file.name:
+            m["name"] = r.file.name
+        ref = media_ref(media)
+        if ref:
+            slot["ref"] = ref
+        return {"type": media_type, "text": caption_text, "media": m}
     if caption_text:
         return {"type": "text", "text": caption_text}
     return None
 
 
-@client.on(events.NewMessage(from_users=list(ADMIN_IDS)))
-async def admin_handler(event: events.NewMessage.Event):
-    text_raw = event.raw_text.strip()
-    if not text_raw:
-        return
-    text = text_raw.lower()
+class InviteJobQueue:
+    def __init__(self, workers: int, maxsize: int):
+        self.n_workers = max(1, workers)
+        self.q = asyncio.Queue(maxsize=max(0, maxsize))
+        self.locks = {}
+        self.workers = []
+        self.running = 0
+        self.waiting = set()
+        self.closed = False
+
+    def depth(self) -> int:
+        return self.q.qsize()
+
+    def start(self):
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.n_workers:
+            self.workers.append(asyncio.get_event_loop().create_task(self._worker()))
+
+    async def submit(self, target, fn, *args) -> asyncio.Future:
+        if self.closed:
+            raise RuntimeError("invite_queue_closed")
+        self.start()
+        fut = asyncio.get_event_loop().create_future()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self.q.full():
+            log_action("invite_queue_full", {"depth": self.depth(), "target": target})
+        await self.q.put((target, fn, args, fut, acct()))
+        return fut
+
+    def submit_after(self, wait, target, fn, *args) -> asyncio.Future:
+        if self.closed:
+            wait.close()
+            raise RuntimeError("invite_queue_closed")
+
+        async def run():
+            await wait
+            return await (await self.submit(target, fn, *args))
+        task = asyncio.get_event_loop().create_task(run())
+        task.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.waiting.add(task)
+        task.add_done_callback(self.waiting.discard)
+        return task
+
+    def _lock(self, target) -> asyncio.Lock:
+        entry = self.locks.get(target)
+        if entry is None:
+            entry = self.locks[target] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _unlock(self, target):
+        entry = self.locks.get(target)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.locks[target]
+
+    async def _worker(self):
+        while True:
+            target, fn, args, fut, a = await self.q.get()
+            CURRENT_ACCOUNT.set(a)
+            lock = self._lock(target)
+            try:
+                async with lock:
+                    self.running += 1
+                    try:
+                        res = await fn(*args)
+                        if not fut.done():
+                            fut.set_result(res)
+                    except Exception as e:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    finally:
+                        self.running -= 1
+            finally:
+                self._unlock(target)
+                self.q.task_done()
+
+    async def close(self, timeout: float = 30.0):
+        if self.waiting:
+            await asyncio.wait(list(self.waiting), timeout=timeout)
+        self.closed = True
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.q.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                log_action("invite_queue_close_timeout", {"depth": self.depth(), "running": self.running})
+        for w in self.workers:
+            w.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
 
-    if text_raw.startswith((".linkv1", ".linkv2", ".linkv3", ".linkv4", ".linkv5", ".linkv6")):
-        link_cmd = text_raw.split()[0].lstrip("/.!").lower()
-        target = await get_target_user_from_context(event)
-        if not target:
-            log_action("link_ignored", {"reason": "no_target", "cmd": link_cmd, "raw": event.raw_text})
-            return
-        old = ACTIVE_INVITES.get(target)
-        if old:
-            old_peer = tier_peer_id(old["tier"])
-            if old_peer:
-                try:
-                    await revoke_invite(old["tier"], old["link"])
-                    ACTIVE_INVITES.pop(target, None)
-                    ACTIVE_INVITES_BY_CHAT.get(old_peer, {}).pop(old["link"], None)
-                    log_action("invite_revoked_old_for_target", {"tier": old["tier"], "target": target, "link": old["link"]})
-                except Exception as e:
-                    log_action("revoke_old_err", {"tier": old["tier"], "target": target, "err": str(e)})
-        link = await create_invite(link_cmd, True)
-        if not link:
+
+INVITE_JOBS = InviteJobQueue(INVITE_WORKERS, INVITE_QUEUE_MAX)
+
+
+async def linkv_job(link_cmd: str, target: int):
+    try:
+        await revoke_old_invite_for_target(target)
+        got = await obtain_invite(link_cmd)
+        if not got:
             log_action("link_error", {"tier": link_cmd, "target": target, "err": "create_invite_failed"})
             return
+        link, expire = got
         await send_invite_to_user(target, link_cmd, link)
-        log_action("invite_sent_manual", {"tier": link_cmd, "target": target, "link": link})
-        ACTIVE_INVITES[target] = {"tier": link_cmd, "link": link, "peer": tier_peer_id(link_cmd)}
-        peer_id = tier_peer_id(link_cmd)
-        if peer_id:
-            ACTIVE_INVITES_BY_CHAT.setdefault(peer_id, {})[link] = target
-            asyncio.create_task(watch_and_revoke_on_first_request(link_cmd, peer_id, link, target))
-        return
-
-    if text.startswith((".addv1", ".addv2", ".addv3", ".addv4", ".addv5", ".addv6")):
-        input_cmd = text.split()[0]
-        relay_cmd_token = input_cmd.replace(".", "/")
-        target = await get_target_user_from_context(event)
-        consumed_first_arg = False
-        if not event.is_reply:
-            parts = text_raw.split()
-            if len(parts) >= 2:
-                a1 = parts[1]
-                if a1.startswith("@") or extract_int_token(a1) is not None:
-                    consumed_first_arg = True
-        if not target:
-            log_action("ignored_addv", {"reason": "no_target", "tier": relay_cmd_token.lstrip("/"), "raw": text_raw})
-            return
-        req_no = None
-        if relay_cmd_token.endswith("1"):
-            req_no = parse_req_no_or_none(text_raw, consumed_first_arg)
-        tier_key = f"v{relay_cmd_token[-1]}"
-        relay_cmd = CMD_MAP.get(tier_key, relay_cmd_token)
-        payload = f"{relay_cmd} {target}" if req_no is None else f"{relay_cmd} {target} {req_no}"
-        await client.send_message(BOT_USERNAME, payload)
-        lp = {"tier": tier_key, "target": target, "to": BOT_USERNAME}
+        log_action("invite_sent_manual", {"tier": link_cmd, "target": target, "link": link, "pooled": expire is not None})
+        register_invite(link_cmd, target, link, expire)
+        return link
+    except Exception as e:
+        log_action("link_error", {"tier": link_cmd, "target": target, "err": str(e)})
+
+
+async def combo_invite_job(link_cmd: str, target: int, req_no: Optional[int]):
+    try:
+        await revoke_old_invite_for_target(target)
+        got = await obtain_invite(link_cmd)
+        if not got:
+            raise RuntimeError("create_invite_failed")
+        link, expire = got
+        await send_invite_to_user(target, link_cmd, link)
+        inv_log = {"tier": link_cmd, "target": target, "link": link, "status": "pending", "pooled": expire is not None}
         if req_no is not None:
-            lp["req_no"] = req_no
-        log_action("relay_addv", lp)
+            inv_log["req_no"] = req_no
+        log_action("invite_sent", inv_log)
+        register_invite(link_cmd, target, link, expire)
+        return link
+    except Exception as e:
+        log_action("invite_dm_failed", {"tier": link_cmd, "target": target, "err": str(e)})
 
-        if COMBO_ON:
-            link_cmd = addv_to_link_cmd(relay_cmd_token)
 
-            async def make_and_send():
-                try:
-                    if WAIT_BOT_REPLY > 0:
-                        try:
-                            bot_ent = await client.get_entity(BOT_USERNAME)
-                            await client.wait_for(events.NewMessage(from_users=bot_ent.id), timeout=WAIT_BOT_REPLY)
-                        except Exception:
-                            pass
-                    await asyncio.sleep(5)
-                    old = ACTIVE_INVITES.get(target)
-                    if old:
-                        old_peer = tier_peer_id(old["tier"])
-                        if old_peer:
-                            try:
-                                await revoke_invite(old["tier"], old["link"])
-                                ACTIVE_INVITES.pop(target, None)
-                                ACTIVE_INVITES_BY_CHAT.get(old_peer, {}).pop(old["link"], None)
-                                log_action("invite_revoked_old_for_target", {"tier": old["tier"], "target": target, "link": old["link"]})
-                            except Exception as e:
-                                log_action("revoke_old_err", {"tier": old["tier"], "target": target, "err": str(e)})
-                    link = await create_invite(link_cmd, True)
-                    if not link:
-                        raise RuntimeError("create_invite_failed")
-                    await send_invite_to_user(target, link_cmd, link)
-                    inv_log = {"tier": link_cmd, "target": target, "link": link, "status": "pending"}
-                    if req_no is not None:
-                        inv_log["req_no"] = req_no
-                    log_action("invite_sent", inv_log)
-                    ACTIVE_INVITES[target] = {"tier": link_cmd, "link": link, "peer": tier_peer_id(link_cmd)}
-                    peer_id = tier_peer_id(link_cmd)
-                    if peer_id:
-                        ACTIVE_INVITES_BY_CHAT.setdefault(peer_id, {})[link] = target
-                        asyncio.create_task(watch_and_revoke_on_first_request(link_cmd, peer_id, link, target))
-                except Exception as e:
-                    log_action("invite_dm_failed", {"tier": link_cmd, "target": target, "err": str(e)})
-
-            if COMBO_ORDER == "relay_first":
-                await make_and_send()
-            else:
-                asyncio.create_task(make_and_send())
+async def relay_addv(tier: str, target: int, req_no: Optional[int]) -> Optional[asyncio.Future]:
+    started = time.monotonic()
+    tier_key = f"v{tier}"
+    relay_cmd = CMD_MAP.get(tier_key, f"/addv{tier}")
+    payload = f"{relay_cmd} {target}" if req_no is None else f"{relay_cmd} {target} {req_no}"
+    a = acct()
+    bot_peer = await a.resolver.peer_or_id("@" + BOT_USERNAME)
+    pending = REPLIES.expect(target) if COMBO_ON and COMBO_ORDER == "relay_first" and WAIT_BOT_REPLY > 0 else None
+    try:
+        sent = await a.rpc.call("send_message", a.client.send_message, bot_peer, payload, prio=PRIO_USER)
+    except Exception:
+        REPLIES.discard(pending)
+        raise
+    REPLIES.bind(pending, getattr(sent, "id", None))
+    lp = {"tier": tier_key, "target": target, "to": BOT_USERNAME}
+    if req_no is not None:
+        lp["req_no"] = req_no
+    log_action("relay_addv", lp)
+    if not COMBO_ON:
+        return None
+    if pending is None:
+        fut = await INVITE_JOBS.submit(target, combo_invite_job, f"linkv{tier}", target, req_no)
+    else:
+        fut = INVITE_JOBS.submit_after(
+            REPLIES.wait(pending, WAIT_BOT_REPLY), target, combo_invite_job, f"linkv{tier}", target, req_no
+        )
+    observe_job(fut, "addv_to_dm_seconds", started)
+    return fut
+
+
+class DedupeCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.items = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _evict(self, now: float):
+        while self.items:
+            key, exp = next(iter(self.items.items()))
+            if exp > now:
+                break
+            self.items.popitem(last=False)
+
+    def check(self, key) -> bool:
+        if self.ttl <= 0:
+            return False
+        now = time.monotonic()
+        self._evict(now)
+        exp = self.items.get(key)
+        if exp is not None and exp > now:
+            return True
+        self.items[key] = now + self.ttl
+        self.items.move_to_end(key)
+        return False
+
+    def discard(self, key):
+        self.items.pop(key, None)
+
+
+DEDUPE = DedupeCache(DEDUPE_SEC)
+
+
+def is_duplicate(key: tuple, event) -> bool:
+    if not DEDUPE.check(key):
+        return False
+    log_action("dedupe_suppressed", {"key": list(key), "msg": getattr(event, "id", None), "raw": event.raw_text})
+    return True
+
+
+def release_on_failure(key: tuple, fut: Optional[asyncio.Future]):
+    if fut is None:
         return
 
-    if text.startswith(".savenote"):
-        parts = text_raw.split(maxsplit=1)
-        if len(parts) < 2 and not event.is_reply:
-            await event.reply("Format: reply konten atau /savenote <judul> | <isi>")
-            return
-        tail = parts[1] if len(parts) > 1 else ""
-        if "|" in tail:
-            title, cap = [p.strip() for p in tail.split("|", 1)]
-        else:
-            title, cap = (tail.strip() or "untitled"), None
-        title_key = sanitize_title(title)
-        note = None
-        if event.is_reply:
-            note = await capture_note_from_reply(event, title_key, cap)
-        elif cap:
-            note = {"type": "text", "text": cap}
-        if not note:
-            await event.reply("Pesan tidak mengandung konten yang bisa disimpan.")
+    def done(f: asyncio.Future):
+        if f.cancelled() or f.exception() is not None or not f.result():
+            DEDUPE.discard(key)
+    fut.add_done_callback(done)
+
+
+BOT_REPLY_ID_RE = re.compile(r"\d{5,}")
+
+
+class PendingRelay:
+    __slots__ = ("target", "msg_id", "fut", "started")
+
+    def __init__(self, target: int, fut: asyncio.Future):
+        self.target = target
+        self.msg_id = None
+        self.fut = fut
+        self.started = time.monotonic()
+
+
+class BotReplyCorrelator:
+    def __init__(self):
+        self.by_msg = {}
+        self.by_target = {}
+        self.count = 0
+
+    def expect(self, target: int) -> PendingRelay:
+        p = PendingRelay(target, asyncio.get_event_loop().create_future())
+        self.by_target.setdefault(target, deque()).append(p)
+        self.count += 1
+        return p
+
+    def bind(self, p: Optional[PendingRelay], msg_id: Optional[int]):
+        if p and msg_id and not p.fut.done():
+            p.msg_id = msg_id
+            self.by_msg[msg_id] = p
+
+    def discard(self, p: Optional[PendingRelay]):
+        if p is None:
             return
-        notes = load_notes()
-        notes[title_key] = note
-        save_notes(notes)
-        log_action("note_saved", {"title": title_key, "type": note["type"]})
-        await event.reply(f"Note '{title_key}' disimpan.")
+        q = self.by_target.get(p.target)
+        if q is not None and p in q:
+            q.remove(p)
+            self.count -= 1
+            if not q:
+                del self.by_target[p.target]
+        if p.msg_id is not None:
+            self.by_msg.pop(p.msg_id, None)
+
+    def _match(self, message):
+        reply_to = getattr(message, "reply_to_msg_id", None)
+        if reply_to in self.by_msg:
+            return self.by_msg[reply_to], "reply"
+        for tok in BOT_REPLY_ID_RE.findall(getattr(message, "raw_text", None) or ""):
+            q = self.by_target.get(int(tok))
+            if q:
+                return q[0], "target_id"
+        if self.count == 1:
+            return next(iter(self.by_target.values()))[0], "only_pending"
+        return None, None
+
+    def resolve(self, message) -> bool:
+        p, via = self._match(message)
+        if p is None:
+            return False
+        self.discard(p)
+        if not p.fut.done():
+            p.fut.set_result(via)
+        return True
+
+    async def wait(self, p: PendingRelay, timeout: float):
+        try:
+            via = await asyncio.wait_for(asyncio.shield(p.fut), timeout=timeout)
+            log_action("bot_reply_matched", {
+                "target": p.target, "via": via, "wait_ms": int((time.monotonic() - p.started) * 1000)
+            })
+        except asyncio.TimeoutError:
+            log_action("bot_reply_timeout", {"target": p.target, "timeout": timeout})
+        finally:
+            self.discard(p)
+
+
+REPLIES = BotReplyCorrelator()
+
+
+@account_handler(lambda: events.NewMessage(incoming=True))
+async def on_bot_reply(event: events.NewMessage.Event):
+    if not REPLIES.count or not event.is_private:
+        return
+    bot = acct().resolver.cached("@" + BOT_USERNAME)
+    if bot is None or event.sender_id != getattr(bot, "user_id", None):
         return
+    REPLIES.resolve(event.message)
+
+
+BULK_TARGET_RE = re.compile(r"^(?:@[A-Za-z0-9_]{4,32}|\d{5,})$")
+BULK_FIELD_RE = re.compile(r"[\r\n,]+")
+BULK_REQ_RE = re.compile(r"^req=(\d+)$", re.I)
+
+
+def parse_bulk_targets(chunks: list) -> tuple:
+    seen = set()
+    out = []
+    rejected = []
+    for chunk in chunks:
+        for field in BULK_FIELD_RE.split(chunk or ""):
+            tok = field.strip()
+            if not tok:
+                continue
+            if not BULK_TARGET_RE.match(tok):
+                rejected.append(preview_text(tok, 40))
+                continue
+            key = tok.lower()
+            if key not in seen:
+                seen.add(key)
+                out.append(tok)
+    return out, rejected
+
+
+async def collect_bulk_targets(event, args: list) -> tuple:
+    chunks = [",".join(args)]
+    if event.is_reply:
+        r = await reply_message(event)
+        if r:
+            chunks.append(r.raw_text or "")
+            if r.document and (r.document.size or 0) <= BULK_FILE_MAX:
+                a = acct()
+                data = await a.rpc.call("download_media", a.client.download_media, r, file=bytes, prio=PRIO_ADMIN)
+                chunks.append((data or b"").decode("utf-8", "replace"))
+    return parse_bulk_targets(chunks)
 
-    if text.startswith(".delnote"):
-        parts = text_raw.split(maxsplit=1)
-        if len(parts) < 2:
-            await event.reply("Gunakan: /delnote <judul>")
-            return
-        title_key = sanitize_title(parts[1])
-        notes = load_notes()
-        if title_key in notes:
-            d = notes_media_dir(title_key)
-            if os.path.exists(d):
-                shutil.rmtree(d)
-            del notes[title_key]
-            save_notes(notes)
-            log_action("note_deleted", {"title": title_key})
-            await event.reply(f"Note '{title_key}' dihapus.")
-        else:
-            await event.reply("Note tidak ditemukan.")
+
+async def edit_status(msg, text: str):
+    try:
+        await acct().rpc.call("edit_message", msg.edit, text, prio=PRIO_ADMIN)
+    except Exception as e:
+        log_action("bulk_status_err", {"err": str(e)})
+
+
+async def progress_loop(status, label: str, state: dict, total: int, failures: list):
+    shown = -1
+    while True:
+        await asyncio.sleep(BULK_PROGRESS_SEC)
+        if state["done"] != shown:
+            shown = state["done"]
+            await edit_status(status, f"{label}: {shown}/{total} selesai, {len(failures)} gagal…")
+
+
+def progress_summary(label: str, elapsed: float, ok: int, failures: list, total: int) -> str:
+    lines = [f"{label} selesai dalam {elapsed:.1f}s: {ok} berhasil, {len(failures)} gagal dari {total}."]
+    for tok, err in failures[:20]:
+        lines.append(f"  ✗ {tok}: {err}")
+    if len(failures) > 20:
+        lines.append(f"  … dan {len(failures) - 20} lainnya")
+    return "\n".join(lines)
+
+
+async def run_bulk(event, kind: str, n: str, tokens: list, req_no: Optional[int], rejected: list = ()):
+    label = f"{kind}{n}"
+    link_cmd = f"linkv{n}"
+    total = len(tokens) + len(rejected)
+    state = {"done": len(rejected), "ok": 0}
+    failures = [(tok, "invalid_target") for tok in rejected]
+    sem = asyncio.Semaphore(max(1, BULK_CONCURRENCY))
+    status = await reply(event, f"Bulk .{label}: memproses {total} target…")
+    started = time.monotonic()
+
+    async def one(tok: str):
+        key = None
+        try:
+            async with sem:
+                target = await acct().resolver.user_id(tok) if tok.startswith("@") else int(tok)
+                if not target:
+                    raise ValueError("target_not_found")
+                if kind == "addv":
+                    if is_duplicate(("addv", f"v{n}", target, req_no), event):
+                        raise ValueError("duplicate")
+                    key = ("addv", f"v{n}", target, req_no)
+                    fut = await relay_addv(n, target, req_no)
+                else:
+                    if is_duplicate(("linkv", link_cmd, target), event):
+                        raise ValueError("duplicate")
+                    key = ("linkv", link_cmd, target)
+                    fut = await INVITE_JOBS.submit(target, linkv_job, link_cmd, target)
+            if fut is not None and not await fut:
+                raise RuntimeError("invite_failed")
+            state["ok"] += 1
+        except Exception as e:
+            if key is not None:
+                DEDUPE.discard(key)
+            failures.append((tok, str(e) or type(e).__name__))
+        finally:
+            state["done"] += 1
+
+    reporter = asyncio.create_task(progress_loop(status, f"Bulk .{label}", state, total, failures))
+    try:
+        await asyncio.gather(*(one(t) for t in tokens))
+    finally:
+        reporter.cancel()
+    elapsed = time.monotonic() - started
+    await edit_status(status, progress_summary(f"Bulk .{label}", elapsed, state["ok"], failures, total))
+    log_action("bulk_done", {
+        "cmd": label, "total": total, "ok": state["ok"], "failed": len(failures), "sec": round(elapsed, 2)
+    })
+
+
+class FanoutStore:
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fanout_jobs ("
+            "id INTEGER PRIMARY KEY, title TEXT NOT NULL, chat INTEGER, created REAL, done REAL)"
+        )
+        cols = {r[1] for r in self.db.execute("PRAGMA table_info(fanout_jobs)")}
+        if "acct" not in cols:
+            self.db.execute("ALTER TABLE fanout_jobs ADD COLUMN acct TEXT")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fanout_targets ("
+            "job INTEGER NOT NULL, target TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending', err TEXT, "
+            "PRIMARY KEY (job, target))"
+        )
+        self.db.commit()
+
+    def create(self, title: str, chat: int, targets: list, acct_name: str = "main") -> int:
+        with self.db:
+            job = self.db.execute(
+                "INSERT INTO fanout_jobs (title, chat, created, acct) VALUES (?, ?, ?, ?)",
+                (title, chat, time.time(), acct_name)
+            ).lastrowid
+            self.db.executemany(
+                "INSERT OR IGNORE INTO fanout_targets (job, target) VALUES (?, ?)", [(job, str(t)) for t in targets]
+            )
+        return job
+
+    def mark(self, job: int, target: str, state: str, err: Optional[str] = None):
+        try:
+            with self.db:
+                self.db.execute(
+                    "UPDATE fanout_targets SET state=?, err=? WHERE job=? AND target=?", (state, err, job, target)
+                )
+        except Exception as e:
+            log.warning("fanout state write failed: %s", e)
+
+    def finish(self, job: int):
+        with self.db:
+            self.db.execute("UPDATE fanout_jobs SET done=? WHERE id=?", (time.time(), job))
+
+    def pending(self, job: int) -> list:
+        rows = self.db.execute(
+            "SELECT target FROM fanout_targets WHERE job=? AND state='pending' ORDER BY rowid", (job,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def counts(self, job: int) -> dict:
+        return dict(self.db.execute(
+            "SELECT state, COUNT(*) FROM fanout_targets WHERE job=? GROUP BY state", (job,)
+        ).fetchall())
+
+    def failures(self, job: int) -> list:
+        return self.db.execute(
+            "SELECT target, err FROM fanout_targets WHERE job=? AND state='failed' ORDER BY rowid", (job,)
+        ).fetchall()
+
+    def unfinished(self) -> list:
+        return self.db.execute(
+            "SELECT id, title, chat, acct FROM fanout_jobs WHERE done IS NULL ORDER BY id"
+        ).fetchall()
+
+
+FANOUT = FanoutStore(NOTES.db)
+FANOUT_TASKS = set()
+
+
+def tier_holders(tier: str) -> list:
+    if tier.lower() == "all":
+        return list(INVITES.by_target)
+    m = TIER_KEY_RE.match(tier.lower()) or re.match(r"^(\d+)$", tier)
+    if not m:
+        return []
+    link_cmd = f"linkv{m.group(1)}"
+    return [t for t, rec in INVITES.by_target.items() if rec.tier == link_cmd]
+
+
+async def run_fanout(job: int, title: str, chat: int, status=None):
+    label = f"Kirim note '{title}' #{job}"
+    note = NOTES.get(title)
+    if note is None:
+        FANOUT.finish(job)
+        log_action("fanout_note_missing", {"job": job, "title": title})
         return
+    counts = FANOUT.counts(job)
+    total = sum(counts.values())
+    targets = FANOUT.pending(job)
+    failures = [tuple(r) for r in FANOUT.failures(job)]
+    state = {"done": total - len(targets), "ok": counts.get("sent", 0)}
+    if status is None:
+        a = acct()
+        status = await a.rpc.call(
+            "send_message", a.client.send_message, chat, f"{label}: melanjutkan {len(targets)} penerima…", prio=PRIO_ADMIN
+        )
+    sem = asyncio.Semaphore(max(1, FANOUT_CONCURRENCY))
+    started = time.monotonic()
 
-    if text.startswith(".listnote"):
-        notes = load_notes()
-        if not notes:
-            await event.reply("Tidak ada note tersimpan.")
-            log_action("note_list", {"count": 0, "shown": 0})
-            return
-        limit = NOTES_LIST_MAX
-        parts = text_raw.split(maxsplit=1)
-        if len(parts) == 2 and parts[1].isdigit():
+    async def one(tok: str):
+        try:
+            async with sem:
+                target = await acct().resolver.user_id(tok) if tok.startswith("@") else int(tok)
+                if not target:
+                    raise ValueError("target_not_found")
+                await send_note(target, title, note, prio=PRIO_BG)
+            FANOUT.mark(job, tok, "sent")
+            state["ok"] += 1
+        except Exception as e:
+            err = str(e) or type(e).__name__
+            FANOUT.mark(job, tok, "failed", err)
+            failures.append((tok, err))
+        finally:
+            state["done"] += 1
+
+    reporter = asyncio.create_task(progress_loop(status, label, state, total, failures))
+    try:
+        rest = deque(targets)
+        while rest and not note_handle_ready(note, acct()):
+            await one(rest.popleft())
+        await asyncio.gather(*(one(t) for t in rest))
+    finally:
+        reporter.cancel()
+    FANOUT.finish(job)
+    elapsed = time.monotonic() - started
+    await edit_status(status, progress_summary(label, elapsed, state["ok"], failures, total))
+    log_action("fanout_done", {
+        "job": job, "title": title, "total": total, "ok": state["ok"], "failed": len(failures), "sec": round(elapsed, 2)
+    })
+
+
+def resume_fanouts():
+    for job, title, chat, acct_name in FANOUT.unfinished():
+        a = ACCOUNTS.get(acct_name or PRIMARY.name)
+        if a is None or not a.alive:
+            a = PRIMARY
+        token = CURRENT_ACCOUNT.set(a)
+        try:
+            task = asyncio.get_event_loop().create_task(run_fanout(job, title, chat))
+        finally:
+            CURRENT_ACCOUNT.reset(token)
+        FANOUT_TASKS.add(task)
+        task.add_done_callback(FANOUT_TASKS.discard)
+        log_action("fanout_resumed", {"job": job, "title": title})
+
+
+METRICS.gauge("invites_live", lambda: len(INVITES))
+METRICS.gauge("watchers_live", lambda: len(WATCHER))
+METRICS.gauge("expiry_heap", lambda: len(EXPIRY))
+METRICS.gauge("invite_queue_depth", lambda: INVITE_JOBS.depth())
+METRICS.gauge("invite_jobs_running", lambda: INVITE_JOBS.running)
+METRICS.gauge("invite_jobs_waiting_reply", lambda: len(INVITE_JOBS.waiting))
+METRICS.gauge("pool_links", lambda: POOL.size())
+METRICS.gauge("rpc_inflight", lambda: sum(a.rpc.inflight for a in ACCOUNTS.values()))
+METRICS.gauge("rpc_waiting", lambda: sum(a.rpc.depth() for a in ACCOUNTS.values()))
+METRICS.gauge("dedupe_keys", lambda: len(DEDUPE))
+
+
+class MetricsExporter:
+    def __init__(self, path: Optional[str], host: str, port: int, every: float):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.every = max(1.0, every)
+        self._task = None
+        self._server = None
+
+    async def start(self):
+        if self.path and self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+        if self.port and self._server is None:
             try:
-                limit = max(1, min(int(parts[1]), NOTES_LIST_MAX))
-            except Exception:
-                limit = NOTES_LIST_MAX
-        titles = list(notes.keys())
-        lines = ["Daftar note:"]
-        shown = 0
-        for idx, title in enumerate(titles, start=1):
-            if shown >= limit:
-                break
-            n = notes.get(title) or {}
-            body = n.get("text", "") or ""
-            prev = preview_text(body, NOTES_PREVIEW_LEN)
-            lines.append(f"{idx}. {title}")
-            lines.append(f"   > {prev or '(kosong)'}")
-            shown += 1
-        if shown < len(titles):
-            lines.append(f"(ditampilkan {shown} dari {len(titles)})")
-        await event.reply("\n".join(lines))
-        log_action("note_list", {"count": len(notes), "shown": shown})
-        return
-
-    if text.startswith(".getnote"):
-        parts = text_raw.split(maxsplit=1)
-        if len(parts) < 2:
-            await event.reply("Gunakan: /getnote <judul>")
-            return
-        title_key = sanitize_title(parts[1])
-        notes = load_notes()
-        note = notes.get(title_key)
-        if not note:
-            await event.reply("Note tidak ditemukan.")
+                self._server = await asyncio.start_server(self._serve, self.host, self.port)
+                log_action("metrics_http", {"host": self.host, "port": self.port})
+            except Exception as e:
+                log_action("metrics_http_err", {"host": self.host, "port": self.port, "err": str(e)})
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.path:
+            self.write()
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(METRICS.render())
+            os.replace(tmp, self.path)
+        except Exception as e:
+            log.warning("metrics export failed: %s", e)
+
+    async def _run(self):
+        while True:
+            self.write()
+            await asyncio.sleep(self.every)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", METRICS.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+
+EXPORTER = MetricsExporter(METRICS_FILE, METRICS_HTTP_HOST, METRICS_HTTP_PORT, METRICS_EXPORT_SEC)
+
+
+TIER_KEY_RE = re.compile(r"^(?:linkv|v)(\d+)$")
+
+
+def config_tiers() -> dict:
+    link = sorted({m.group(1) for m in map(TIER_KEY_RE.match, VIP_MAP) if m}, key=int)
+    relay = sorted({m.group(1) for m in map(TIER_KEY_RE.match, CMD_MAP) if m} | set(link), key=int)
+    return {"linkv": link, "addv": relay}
+
+
+class AdminCommand:
+    __slots__ = ("name", "kind", "tier", "args", "tail", "raw", "target_token", "req_no", "started")
+
+    def __init__(self, name: str, kind: str, tier: Optional[str], args: list, tail: str, raw: str):
+        self.name = name
+        self.kind = kind
+        self.tier = tier
+        self.args = args
+        self.tail = tail
+        self.raw = raw
+        self.target_token = args[0] if args and is_target_token(args[0]) else None
+        self.req_no = None
+        self.started = time.monotonic()
+
+
+class CommandSpec:
+    __slots__ = ("kind", "fn", "tiers", "dedupe_msg", "sem")
+
+    def __init__(self, kind: str, fn, tiers: Optional[str], dedupe_msg: bool, limit: int):
+        self.kind = kind
+        self.fn = fn
+        self.tiers = tiers
+        self.dedupe_msg = dedupe_msg
+        self.sem = asyncio.Semaphore(limit) if limit > 0 else None
+
+
+class CommandRegistry:
+    def __init__(self):
+        self.specs = {}
+        self.table = {}
+        self.hooks = []
+
+    def command(self, kind: str, tiers: Optional[str] = None, dedupe_msg: bool = False):
+        def deco(fn):
+            self.specs[kind] = CommandSpec(kind, fn, tiers, dedupe_msg, int(CMD_LIMITS.get(kind, 0)))
+            return fn
+        return deco
+
+    def hook(self, fn):
+        self.hooks.append(fn)
+        return fn
+
+    def build(self):
+        tiers = config_tiers()
+        table = {}
+        for kind, spec in self.specs.items():
+            if spec.tiers:
+                for n in tiers[spec.tiers]:
+                    table[kind + n] = (spec, n)
+            else:
+                table[kind] = (spec, None)
+        self.table = table
+        log_action("commands_built", {"commands": len(table), "tiers": tiers})
+
+    def parse(self, text_raw: str) -> Optional[AdminCommand]:
+        text_raw = (text_raw or "").strip()
+        if not text_raw.startswith("."):
+            return None
+        head, tail = (text_raw.split(maxsplit=1) + [""])[:2]
+        name = head[1:].lower()
+        hit = self.table.get(name)
+        if hit is None:
+            return None
+        spec, tier = hit
+        tail = tail.strip()
+        cmd = AdminCommand(name, spec.kind, tier, tail.split(), tail, text_raw)
+        if spec.kind == "addv" and tier == "1":
+            cmd.req_no = parse_req_no_or_none(cmd.args, cmd.target_token is not None)
+        return cmd
+
+    async def dispatch(self, event, cmd: AdminCommand):
+        spec = self.specs[cmd.kind]
+        if spec.dedupe_msg and is_duplicate(("msg", event.chat_id, event.id), event):
             return
-        target_id = event.chat_id
-        if event.is_reply:
-            r = await event.get_reply_message()
-            target_id = r.sender_id if r else event.chat_id
+        err = None
         try:
-            if note["type"] == "text":
-                await client.send_message(target_id, note.get("text", "") or "")
+            if spec.sem is None:
+                await spec.fn(event, cmd)
             else:
-                media = note.get("media") or {}
-                path = media.get("path")
-                if path and os.path.exists(path):
-                    await client.send_file(target_id, path, caption=note.get("text", "") or "", force_document=(note["type"] == "document"))
-                else:
-                    await client.send_message(target_id, note.get("text", "") or "")
-            log_action("note_get_sent", {"title": title_key, "type": note["type"], "target": target_id})
+                async with spec.sem:
+                    await spec.fn(event, cmd)
         except Exception as e:
-            log_action("note_get_send_error", {"title": title_key, "err": str(e)})
-        return
-
-    if text.startswith(".help"):
-        help_text = (
-            "Panduan Perintah Usher Bot\n\n"
-            "ADD (relay ke Bot Utama):\n"
-            "  .addv1  [reply user] [opsional: <request_no 1-100>] → /addv1 <user_id> [no]\n"
-            "  .addv2  [reply user] → /addv2 <user_id>\n"
-            "  .addv3  [reply user] → /addv3 <user_id>\n"
-            "  .addv4  [reply user] → /addv4 <user_id>\n"
-            "  .addv5  [reply user] → /addv5 <user_id>\n"
-            "  .addv6  [reply user] → /addv6 <user_id>\n\n"
-            "LINK (DM link join-request, TTL 24 jam, auto-revoke pada request pertama dan saat ACC):\n"
-            "  .linkv1  [reply user]\n"
-            "  .linkv2  [reply user]\n"
-            "  .linkv3  [reply user]\n"
-            "  .linkv4  [reply user]\n"
-            "  .linkv5  [reply user]\n"
-            "  .linkv6  [reply user]\n\n"
-            "NOTES:\n"
-            "  .savenote <judul> | <isi>    atau reply konten lalu: /savenote <judul>\n"
-            "  .delnote <judul>\n"
-            "  .listnote [maks_item]\n"
-            "  .getnote <judul>\n"
+            err = e
+            raise
+        finally:
+            elapsed = time.monotonic() - cmd.started
+            for h in self.hooks:
+                h(cmd, elapsed, err)
+
+
+COMMANDS = CommandRegistry()
+
+
+@COMMANDS.hook
+def command_metrics(cmd: AdminCommand, seconds: float, err: Optional[Exception]):
+    METRICS.observe("command_seconds", seconds, cmd.name)
+    if err is not None:
+        METRICS.inc("command_errors_total", cmd.name)
+
+
+@COMMANDS.command("bulkaddv", tiers="addv", dedupe_msg=True)
+@COMMANDS.command("bulklinkv", tiers="linkv", dedupe_msg=True)
+async def cmd_bulk(event, cmd: AdminCommand):
+    kind = cmd.kind[len("bulk"):]
+    req_no = None
+    args = []
+    for tok in cmd.args:
+        m = BULK_REQ_RE.match(tok)
+        if m:
+            req_no = clip_req(int(m.group(1))) if cmd.tier == "1" else None
+        else:
+            args.append(tok)
+    tokens, rejected = await collect_bulk_targets(event, args)
+    if not tokens:
+        msg = "Tidak ada target (id / @username) yang ditemukan."
+        if rejected:
+            msg += f" {len(rejected)} baris ditolak, contoh: {', '.join(rejected[:5])}"
+        await reply(event, msg)
+        return
+    if len(tokens) > BULK_MAX_TARGETS:
+        await reply(event, f"Terlalu banyak target ({len(tokens)}), maksimal {BULK_MAX_TARGETS}.")
+        return
+    await run_bulk(event, kind, cmd.tier, tokens, req_no, rejected)
+
+
+@COMMANDS.command("linkv", tiers="linkv", dedupe_msg=True)
+async def cmd_linkv(event, cmd: AdminCommand):
+    target = await get_target_user_from_context(event, cmd.args)
+    if not target:
+        log_action("link_ignored", {"reason": "no_target", "cmd": cmd.name, "raw": cmd.raw})
+        return
+    key = ("linkv", cmd.name, target)
+    if is_duplicate(key, event):
+        await reply(event, f"Permintaan .{cmd.name} untuk {target} sudah diproses, diabaikan.")
+        return
+    try:
+        fut = await INVITE_JOBS.submit(target, linkv_job, cmd.name, target)
+    except Exception:
+        DEDUPE.discard(key)
+        raise
+    release_on_failure(key, fut)
+    observe_job(fut, "linkv_to_dm_seconds", cmd.started)
+
+
+@COMMANDS.command("addv", tiers="addv", dedupe_msg=True)
+async def cmd_addv(event, cmd: AdminCommand):
+    target = await get_target_user_from_context(event, cmd.args)
+    if not target:
+        log_action("ignored_addv", {"reason": "no_target", "tier": cmd.name, "raw": cmd.raw})
+        return
+    req_no = cmd.req_no
+    if event.is_reply and cmd.tier == "1":
+        req_no = parse_req_no_or_none(cmd.args, False)
+    key = ("addv", f"v{cmd.tier}", target, req_no)
+    if is_duplicate(key, event):
+        await reply(event, f"Permintaan .{cmd.name} untuk {target} sudah diproses, diabaikan.")
+        return
+    try:
+        fut = await relay_addv(cmd.tier, target, req_no)
+    except Exception:
+        DEDUPE.discard(key)
+        raise
+    release_on_failure(key, fut)
+
+
+@COMMANDS.command("savenote")
+async def cmd_savenote(event, cmd: AdminCommand):
+    if not cmd.tail and not event.is_reply:
+        await reply(event, "Format: reply konten atau /savenote <judul> | <isi>")
+        return
+    if "|" in cmd.tail:
+        title, cap = [p.strip() for p in cmd.tail.split("|", 1)]
+    else:
+        title, cap = (cmd.tail or "untitled"), None
+    title_key = sanitize_title(title)
+    note = None
+    if event.is_reply:
+        try:
+            note = await capture_note_from_reply(event, title_key, cap)
+        except MediaTooLarge as e:
+            log_action("note_media_too_large", {"title": title_key, "size": e.args[0]})
+            await reply(event, f"Media terlalu besar (maks {NOTES_MEDIA_MAX // (1024 * 1024)} MB).")
+            return
+    elif cap:
+        note = {"type": "text", "text": cap}
+    if not note:
+        await reply(event, "Pesan tidak mengandung konten yang bisa disimpan.")
+        return
+    old = NOTES.get(title_key)
+    drop_legacy_media(title_key, old)
+    NOTES.put(title_key, note)
+    log_action("note_saved", {"title": title_key, "type": note["type"]})
+    await reply(event, f"Note '{title_key}' disimpan.")
+
+
+@COMMANDS.command("delnote")
+async def cmd_delnote(event, cmd: AdminCommand):
+    if not cmd.tail:
+        await reply(event, "Gunakan: /delnote <judul>")
+        return
+    title_key = sanitize_title(cmd.tail)
+    if title_key in NOTES:
+        drop_legacy_media(title_key, NOTES.get(title_key))
+        NOTES.delete(title_key)
+        log_action("note_deleted", {"title": title_key})
+        await reply(event, f"Note '{title_key}' dihapus.")
+    else:
+        await reply(event, "Note tidak ditemukan.")
+
+
+PAGE_ARG_RE = re.compile(r"^(?:p|hal)=(\d+)$", re.I)
+
+
+def page_args(args: list, default_limit: int, max_limit: int) -> tuple:
+    page, limit, rest = 1, default_limit, []
+    for tok in args:
+        m = PAGE_ARG_RE.match(tok)
+        if m:
+            page = max(1, int(m.group(1)))
+        elif tok.isdigit() and not rest:
+            limit = max(1, min(int(tok), max_limit))
+        else:
+            rest.append(tok)
+    return page, limit, rest
+
+
+def note_lines(titles: list, first_idx: int) -> list:
+    lines = []
+    for idx, title in enumerate(titles, start=first_idx):
+        body = (NOTES.get(title) or {}).get("text", "") or ""
+        lines.append(f"{idx}. {title}")
+        lines.append(f"   > {preview_text(body, NOTES_PREVIEW_LEN) or '(kosong)'}")
+    return lines
+
+
+def page_footer(page: int, limit: int, total: int, next_cmd: str) -> Optional[str]:
+    pages = max(1, (total + limit - 1) // limit)
+    if pages == 1:
+        return None
+    tail = f" · berikutnya: {next_cmd} p={page + 1}" if page < pages else ""
+    return f"(halaman {page}/{pages}, total {total}){tail}"
+
+
+@COMMANDS.command("listnote")
+async def cmd_listnote(event, cmd: AdminCommand):
+    if not NOTES:
+        await reply(event, "Tidak ada note tersimpan.")
+        log_action("note_list", {"count": 0, "shown": 0})
+        return
+    page, limit, _ = page_args(cmd.args, NOTES_LIST_MAX, NOTES_LIST_MAX)
+    offset = (page - 1) * limit
+    titles = NOTES.titles_page(offset, limit)
+    if not titles:
+        await reply(event, f"Halaman {page} kosong (total {len(NOTES)} note).")
+        return
+    lines = ["Daftar note:"] + note_lines(titles, offset + 1)
+    limit_arg = f" {limit}" if limit != NOTES_LIST_MAX else ""
+    footer = page_footer(page, limit, len(NOTES), f".listnote{limit_arg}")
+    if footer:
+        lines.append(footer)
+    await reply(event, "\n".join(lines))
+    log_action("note_list", {"count": len(NOTES), "shown": len(titles), "page": page})
+
+
+@COMMANDS.command("findnote")
+async def cmd_findnote(event, cmd: AdminCommand):
+    page = 1
+    words = []
+    for tok in cmd.args:
+        m = PAGE_ARG_RE.match(tok)
+        if m:
+            page = max(1, int(m.group(1)))
+        else:
+            words.append(tok)
+    query = " ".join(words)
+    if not query:
+        await reply(event, "Gunakan: .findnote <kata kunci> [p=<halaman>]")
+        return
+    limit = NOTES_FIND_MAX
+    hits = NOTES.search(query, page * limit)
+    offset = (page - 1) * limit
+    titles = hits[offset:offset + limit]
+    if not titles:
+        await reply(event, f"Tidak ada note yang cocok dengan '{query}'." if not hits else f"Halaman {page} kosong.")
+        log_action("note_find", {"query": query, "hits": len(hits)})
+        return
+    lines = [f"Hasil pencarian '{query}':"] + note_lines(titles, offset + 1)
+    footer = page_footer(page, limit, len(hits), f".findnote {query}")
+    if footer:
+        lines.append(footer)
+    await reply(event, "\n".join(lines))
+    log_action("note_find", {"query": query, "hits": len(hits), "page": page})
+
+
+@COMMANDS.command("getnote")
+async def cmd_getnote(event, cmd: AdminCommand):
+    if not cmd.tail:
+        await reply(event, "Gunakan: /getnote <judul>")
+        return
+    title_key = sanitize_title(cmd.tail)
+    note = NOTES.get(title_key)
+    if not note:
+        await reply(event, "Note tidak ditemukan.")
+        return
+    target_id = event.chat_id
+    if event.is_reply:
+        r = await reply_message(event)
+        target_id = r.sender_id if r else event.chat_id
+    try:
+        await send_note(target_id, title_key, note)
+        log_action("note_get_sent", {"title": title_key, "type": note["type"], "target": target_id})
+    except Exception as e:
+        log_action("note_get_send_error", {"title": title_key, "err": str(e)})
+
+
+@COMMANDS.command("sendnote")
+async def cmd_sendnote(event, cmd: AdminCommand):
+    title_part, _, target_part = cmd.tail.partition("|")
+    title_key = sanitize_title(title_part)
+    if not title_key:
+        await reply(event, "Gunakan: .sendnote <judul> | <id/@user ...> [tier=<n>|tier=all]  (atau reply daftar target)")
+        return
+    note = NOTES.get(title_key)
+    if not note:
+        await reply(event, "Note tidak ditemukan.")
+        return
+    args = []
+    holders = []
+    for tok in target_part.split():
+        if tok.lower().startswith("tier="):
+            holders += tier_holders(tok[5:])
+        else:
+            args.append(tok)
+    targets, rejected = await collect_bulk_targets(event, args) if args or event.is_reply else ([], [])
+    seen = {t.lower() for t in targets}
+    for t in map(str, holders):
+        if t not in seen:
+            seen.add(t)
+            targets.append(t)
+    if not targets:
+        await reply(event, "Tidak ada penerima (id / @username / tier) yang ditemukan.")
+        return
+    if len(targets) > FANOUT_MAX_TARGETS:
+        await reply(event, f"Terlalu banyak penerima ({len(targets)}), maksimal {FANOUT_MAX_TARGETS}.")
+        return
+    job = FANOUT.create(title_key, event.chat_id, targets + rejected, acct().name)
+    for tok in rejected:
+        FANOUT.mark(job, tok, "failed", "invalid_target")
+    log_action("fanout_started", {"job": job, "title": title_key, "targets": len(targets)})
+    status = await reply(event, f"Kirim note '{title_key}' #{job}: memproses {len(targets)} penerima…")
+    await run_fanout(job, title_key, event.chat_id, status)
+
+
+@COMMANDS.command("queue")
+async def cmd_queue(event, cmd: AdminCommand):
+    await reply(
+        event,
+        f"Antrian invite: {len(INVITE_JOBS.waiting)} menunggu balasan bot, {INVITE_JOBS.depth()} menunggu, "
+        f"{INVITE_JOBS.running} berjalan, "
+        f"{INVITE_JOBS.n_workers} worker, {len(INVITE_JOBS.locks)} target aktif."
+    )
+
+
+@COMMANDS.command("stats")
+async def cmd_stats(event, cmd: AdminCommand):
+    await reply(event, METRICS.summary())
+
+
+@COMMANDS.command("accounts")
+async def cmd_accounts(event, cmd: AdminCommand):
+    owned = {}
+    for k in VIP_MAP:
+        peer = tier_peer_id(k)
+        if peer is not None:
+            owned.setdefault(owner_candidates(peer)[0].name, []).append(k)
+    links = {}
+    for name, _ in LINK_OWNER.values():
+        links[name] = links.get(name, 0) + 1
+    lines = [f"Akun admin ({len(ACCOUNTS)}):"]
+    for a in ACCOUNTS.values():
+        blocked = [f"{m} {a.blocked_for(m):.0f}s" for m in sorted(a.rpc.buckets) if a.blocked_for(m) > 0]
+        lines.append(
+            f"• {a.name}{'' if a.alive else ' (mati)'}{' [aktif]' if a is acct() else ''}: "
+            f"{a.rpc.inflight} berjalan, {a.rpc.depth()} antri, FloodWait {a.rpc.floods}x, "
+            f"{links.get(a.name, 0)} link"
         )
-        await event.reply(help_text)
-        log_action("show_help", {"from": event.sender_id})
+        if blocked:
+            lines.append("   terblokir: " + ", ".join(blocked))
+        if owned.get(a.name):
+            lines.append("   tier: " + ", ".join(owned[a.name]))
+    await reply(event, "\n".join(lines))
+
+
+@COMMANDS.command("reload")
+async def cmd_reload(event, cmd: AdminCommand):
+    ok, res = await RELOADER.reload(f"admin:{event.sender_id}")
+    if not ok:
+        await reply(event, f"Config tidak valid, tetap pakai config lama: {res}")
+        return
+    lines = ["Config dimuat ulang."]
+    lines.append("Berubah: " + (", ".join(res["changed"]) if res["changed"] else "(tidak ada)"))
+    if res["peers_added"]:
+        lines.append("Peer baru: " + ", ".join(map(str, res["peers_added"])))
+    if res["restart_needed"]:
+        lines.append("Perlu restart agar berlaku: " + ", ".join(res["restart_needed"]))
+    await reply(event, "\n".join(lines))
+
+
+REPORT_OPT_RE = re.compile(r"^(from|to|tier|limit)=(\S+)$", re.I)
+REPLY_MAX = 4000
+
+
+def reply_chunks(lines: list) -> list:
+    out = []
+    buf = ""
+    for line in lines:
+        line = line[:REPLY_MAX]
+        if buf and len(buf) + len(line) + 1 > REPLY_MAX:
+            out.append(buf)
+            buf = ""
+        buf = f"{buf}\n{line}" if buf else line
+    if buf:
+        out.append(buf)
+    return out
+
+
+@COMMANDS.command("report")
+async def cmd_report(event, cmd: AdminCommand):
+    name = "daily"
+    value = None
+    opts = {}
+    for tok in cmd.args:
+        m = REPORT_OPT_RE.match(tok)
+        if m:
+            opts[m.group(1).lower()] = m.group(2)
+        elif tok.lower() in REPORTS and name == "daily":
+            name = tok.lower()
+        else:
+            value = tok
+    if name in ("target", "link") and not value:
+        arg = "user_id" if name == "target" else "link"
+        await reply(event, f"Gunakan: .report {name} <{arg}> [from=YYYY-MM-DD] [to=YYYY-MM-DD]")
+        return
+    try:
+        since = parse_bound(opts.get("from"))
+        until = parse_bound(opts.get("to"), end=True)
+        limit = max(1, min(int(opts.get("limit", REPORT_LIMIT)), 200))
+        if name == "target":
+            value = int(value)
+    except ValueError as e:
+        await reply(event, f"Parameter tidak valid: {e}")
+        return
+    lines = await asyncio.get_event_loop().run_in_executor(
+        None, run_report, name, INVITE_LOG, since, until, opts.get("tier"), value, limit,
+        AUDIT_INDEX_PATH if REPORT_INDEX else None
+    )
+    log_action("report_run", {"report": name, "from": opts.get("from"), "to": opts.get("to"), "head": lines[0]})
+    for chunk in reply_chunks(lines):
+        await reply(event, chunk)
+
+
+def help_text() -> str:
+    tiers = config_tiers()
+    lines = ["Panduan Perintah Usher Bot", "", "ADD (relay ke Bot Utama):"]
+    for n in tiers["addv"]:
+        relay = CMD_MAP.get(f"v{n}", f"/addv{n}")
+        if n == "1":
+            lines.append(f"  .addv1  [reply user] [opsional: <request_no {ADDV_MIN}-{ADDV_MAX}>] → {relay} <user_id> [no]")
+        else:
+            lines.append(f"  .addv{n}  [reply user] → {relay} <user_id>")
+    lines += ["", "LINK (DM link join-request, TTL 24 jam, auto-revoke pada request pertama dan saat ACC):"]
+    lines += [f"  .linkv{n}  [reply user]" for n in tiers["linkv"]]
+    lines += [
+        "",
+        "BULK (banyak target sekaligus; inline atau reply teks/dokumen, 1 id/@username per baris atau dipisah koma):",
+        "  .bulkaddvN <id/@user ...> [req=<no>]",
+        "  .bulklinkvN <id/@user ...>",
+        "",
+        "NOTES:",
+        "  .savenote <judul> | <isi>    atau reply konten lalu: /savenote <judul>",
+        "  .delnote <judul>",
+        "  .listnote [maks_item] [p=<halaman>]",
+        "  .findnote <kata kunci> [p=<halaman>]   (judul/isi, prefix & mirip)",
+        "  .getnote <judul>",
+        "  .sendnote <judul> | <id/@user ...> [tier=<n>|tier=all]   (atau reply daftar target)",
+        "",
+        "LAINNYA:",
+        "  .queue    (status antrian invite)",
+        "  .stats    (metrik latensi, error & jumlah invite/watcher aktif)",
+        "  .accounts (akun admin, FloodWait & pembagian tier)",
+        "  .reload   (muat ulang config.json tanpa restart)",
+        "  .report [daily|latency|nojoin|actions|target <id>|link <url>] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [tier=linkvN]",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@COMMANDS.command("help")
+async def cmd_help(event, cmd: AdminCommand):
+    await reply(event, help_text())
+    log_action("show_help", {"from": event.sender_id})
+
+
+COMMANDS.build()
+
+
+CMD_SEEN = DedupeCache(60)
+
+
+def command_key(event) -> tuple:
+    if event.is_channel:
+        return ("cmd", event.chat_id, event.id)
+    if event.is_private:
+        return ("cmd", acct().name, event.chat_id, event.id)
+    return ("cmd", event.chat_id, event.sender_id, int(event.date.timestamp()), event.raw_text)
+
+
+@account_handler(lambda: events.NewMessage(from_users=list(ADMIN_IDS)))
+async def admin_handler(event: events.NewMessage.Event):
+    cmd = COMMANDS.parse(event.raw_text)
+    if cmd is None:
+        return
+    if len(ACCOUNTS) > 1 and CMD_SEEN.check(command_key(event)):
+        return
+    await COMMANDS.dispatch(event, cmd)
+
+
+@account_handler(lambda: events.Raw(types=[types.UpdatePendingJoinRequests, types.UpdateBotChatInviteRequester]))
+async def on_join_request_update(update):
+    if JOIN_REQ_MODE != "push":
+        return
+    try:
+        peer_id = utils.get_peer_id(update.peer)
+    except Exception:
+        return
+    chat_links = INVITES.peer_links(peer_id)
+    if not chat_links:
+        return
+    if isinstance(update, types.UpdateBotChatInviteRequester):
+        link = getattr(update.invite, "link", None)
+        if link in chat_links:
+            WATCHER.fire(peer_id, link, 1, "push")
+        return
+    if not update.requests_pending:
         return
+    fired = False
+    for uid in update.recent_requesters or []:
+        rec = INVITES.get(uid)
+        if rec and rec.link in chat_links:
+            fired = WATCHER.fire(peer_id, rec.link, update.requests_pending, "push") or fired
+    if not fired:
+        WATCHER.poke(peer_id)
 
 
-@client.on(events.ChatAction)
+JOIN_SEEN = DedupeCache(30)
+
+
+@account_handler(lambda: events.ChatAction)
 async def on_chat_action(event: events.ChatAction.Event):
     if not (event.user_joined or event.user_added):
         return
     try:
-        user = await event.get_user()
+        user = await acct().rpc.call("get_entity", event.get_user, prio=PRIO_USER)
         uid = user.id
     except Exception:
         return
@@ -601,62 +3455,205 @@ async def on_chat_action(event: events.ChatAction.Event):
         peer_id = event.chat_id
     except Exception:
         peer_id = None
+    if len(ACCOUNTS) > 1 and JOIN_SEEN.check(("join", peer_id, uid)):
+        return
 
-    rec = ACTIVE_INVITES.pop(uid, None)
+    rec = INVITES.consume(uid)
     if rec:
         try:
-            await revoke_invite(rec["tier"], rec["link"])
-            if rec.get("peer"):
-                await decline_all_pending(rec["peer"], rec["link"])
-            log_action("invite_consumed", {"tier": rec["tier"], "target": uid, "link": rec["link"]})
+            await revoke_invite(rec.tier, rec.link, rec.peer)
+            if rec.peer:
+                await decline_all_pending(rec.peer, rec.link)
+            log_action("invite_consumed", {"tier": rec.tier, "target": uid, "link": rec.link})
         except Exception as e:
-            log_action("invite_consume_err", {"tier": rec["tier"], "target": uid, "err": str(e)})
-        p = tier_peer_id(rec["tier"])
-        if p:
-            ACTIVE_INVITES_BY_CHAT.get(p, {}).pop(rec["link"], None)
-        return
-
-    if peer_id and peer_id in ACTIVE_INVITES_BY_CHAT and ACTIVE_INVITES_BY_CHAT[peer_id]:
-        link_to_revoke, target_id = next(reversed(ACTIVE_INVITES_BY_CHAT[peer_id].items()))
-        tier_key = None
-        for tid, info in ACTIVE_INVITES.items():
-            if info.get("link") == link_to_revoke:
-                tier_key = info.get("tier")
-                break
-        if not tier_key:
-            try:
-                with open(INVITE_LOG, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                for line in reversed(lines):
-                    d = json.loads(line)
-                    if d.get("link") == link_to_revoke:
-                        tier_key = d.get("tier")
-                        break
-            except Exception:
-                pass
-        if tier_key:
+            log_action("invite_consume_err", {"tier": rec.tier, "target": uid, "err": str(e)})
+        return
+
+    hit = INVITE_INDEX.latest_for_target(uid, peer_id) if peer_id else None
+    if hit and not hit["consumed"] and hit["tier"]:
+        try:
+            await revoke_invite(hit["tier"], hit["link"], peer_id)
+            await decline_all_pending(peer_id, hit["link"])
+            log_action("invite_consumed_fallback", {"tier": hit["tier"], "target": uid, "link": hit["link"], "via": "index"})
+        except Exception as e:
+            log_action("invite_consume_err_fallback", {"tier": hit["tier"], "target": uid, "err": str(e)})
+        return
+
+    rec = INVITES.latest_for_peer(peer_id) if peer_id else None
+    if rec:
+        INVITES.revoke(rec.link)
+        try:
+            await revoke_invite(rec.tier, rec.link, rec.peer)
+            await decline_all_pending(peer_id, rec.link)
+            log_action("invite_consumed_fallback", {"tier": rec.tier, "target": uid, "link": rec.link})
+        except Exception as e:
+            log_action("invite_consume_err_fallback", {"tier": rec.tier, "target": uid, "err": str(e)})
+
+
+RESTART_KEYS = (
+    ("telegram", None), ("storage", None), ("metrics", None), ("behavior", "invite_workers"),
+    ("behavior", "invite_queue_max"), ("behavior", "config_watch_sec"), ("rpc", "shard_vnodes"),
+)
+
+
+def restart_needed(old: dict, new: dict) -> list:
+    out = []
+    for section, key in RESTART_KEYS:
+        a, b = old.get(section, {}), new.get(section, {})
+        if key is not None:
+            a, b = a.get(key), b.get(key)
+        if a != b:
+            out.append(section if key is None else f"{section}.{key}")
+    return out
+
+
+def apply_settings(settings: dict) -> list:
+    g = globals()
+    changed = [k for k, v in settings.items() if g[k] != v]
+    g.update(settings)
+    DEDUPE.ttl = DEDUPE_SEC
+    for a in ACCOUNTS.values():
+        a.rpc.max_inflight = RPC_MAX_INFLIGHT
+        for method, b in a.rpc.buckets.items():
+            rate, burst = RPC_RATES.get(method, RPC_DEFAULT_RATE)
+            b.rate = max(float(rate), 0.001)
+            b.burst = max(float(burst), 1.0)
+        a.rpc._pump()
+    if "CMD_LIMITS" in changed:
+        for spec in COMMANDS.specs.values():
+            limit = int(CMD_LIMITS.get(spec.kind, 0))
+            spec.sem = asyncio.Semaphore(limit) if limit > 0 else None
+    COMMANDS.build()
+    if "ADMIN_IDS" in changed:
+        for a in ACCOUNTS.values():
+            bind_handlers(a, only=admin_handler)
+    return changed
+
+
+class ConfigReloader:
+    def __init__(self, path: str, every: float):
+        self.path = path
+        self.every = every
+        self.booted = CFG
+        self.stamp = self._stat()
+        self.lock = asyncio.Lock()
+        self._task = None
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    async def reload(self, source: str) -> tuple:
+        async with self.lock:
+            self.stamp = self._stat()
             try:
-                await revoke_invite(tier_key, link_to_revoke)
-                await decline_all_pending(peer_id, link_to_revoke)
-                log_action("invite_consumed_fallback", {"tier": tier_key, "target": uid, "link": link_to_revoke})
+                new = load_cfg()
+                settings = cfg_settings(new)
+                check_settings(settings)
             except Exception as e:
-                log_action("invite_consume_err_fallback", {"tier": tier_key, "target": uid, "err": str(e)})
-        ACTIVE_INVITES_BY_CHAT[peer_id].pop(link_to_revoke, None)
-        for tid in list(ACTIVE_INVITES.keys()):
-            if ACTIVE_INVITES[tid].get("link") == link_to_revoke:
-                ACTIVE_INVITES.pop(tid, None)
-                break
+                log_action("config_reload_err", {"source": source, "err": str(e)})
+                return False, str(e)
+            old_peers = {k: tier_peer_id(k) for k in VIP_MAP}
+            restart = restart_needed(self.booted, new)
+            changed = apply_settings(settings)
+            globals()["CFG"] = new
+            new_peers = {k: tier_peer_id(k) for k in VIP_MAP}
+            dropped = {k: p for k, p in old_peers.items() if new_peers.get(k) != p}
+            added = sorted({p for k, p in new_peers.items() if old_peers.get(k) != p and p is not None})
+            if dropped:
+                await POOL.drop_tiers(dropped)
+            POOL._poke()
+            warm = added + (["@" + BOT_USERNAME] if "BOT_USERNAME" in changed else [])
+            if warm:
+                await asyncio.gather(*(a.resolver.warm(warm) for a in ACCOUNTS.values() if a.alive))
+            log_action("config_reloaded", {
+                "source": source, "changed": changed, "peers_added": added,
+                "tiers_dropped": sorted(dropped), "restart_needed": restart,
+            })
+            return True, {"changed": changed, "peers_added": added, "restart_needed": restart}
+
+    def start(self):
+        if self.every > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.every)
+            stamp = self._stat()
+            if stamp is not None and stamp != self.stamp:
+                await self.reload("file")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+
+RELOADER = ConfigReloader(CFG_PATH, CONFIG_WATCH_SEC)
 
 
 async def main():
+    restore_invites()
+    for a in ACCOUNTS.values():
+        bind_handlers(a)
     if PREFER_STRING and not STRING_SESSION:
         await interactive_login_and_persist_string()
     else:
         await client.connect()
+    for a in ACCOUNTS.values():
+        if a is PRIMARY:
+            continue
+        try:
+            await a.client.connect()
+            a.alive = await a.client.is_user_authorized()
+        except Exception as e:
+            a.alive = False
+            log_action("account_connect_err", {"acct": a.name, "err": str(e)})
+            continue
+        if not a.alive:
+            log_action("account_unauthorized", {"acct": a.name})
+    live = [a for a in ACCOUNTS.values() if a.alive]
+    warm = [tier_peer_id(k) for k in VIP_MAP] + ["@" + BOT_USERNAME]
+    await asyncio.gather(*(a.resolver.warm(warm) for a in live))
+    POOL.restore()
+    POOL.start()
+    await EXPORTER.start()
+    RELOADER.start()
+    resume_fanouts()
+    log_action("accounts_ready", {"live": [a.name for a in live], "total": len(ACCOUNTS)})
     print("UsherBot started.")
-    await client.run_until_disconnected()
+    await asyncio.gather(*(a.client.run_until_disconnected() for a in live))
+
+
+async def shutdown():
+    await INVITE_JOBS.close()
+    await POOL.close()
+    await WATCHER.stop()
+    await EXPIRY.stop()
+    await EXPORTER.stop()
+    await RELOADER.stop()
+    for task in list(FANOUT_TASKS):
+        task.cancel()
+    for a in ACCOUNTS.values():
+        if a is not PRIMARY and a.client.is_connected():
+            await a.client.disconnect()
 
 
 if __name__ == "__main__":
-    with client:
-        client.loop.run_until_complete(main())
+    try:
+        with client:
+            try:
+                client.loop.run_until_complete(main())
+            except KeyboardInterrupt:
+                pass
+            finally:
+                client.loop.run_until_complete(shutdown())
+    finally:
+        AUDIT.close()
@@ -0,0 +1,558 @@
+import os
+import re
+import sys
+import json
+import glob
+import gzip
+import time
+import bisect
+import sqlite3
+import argparse
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+SEGMENT_RE = re.compile(r"\.(\d{8}-\d{6}(?:-\d+)?)(\.gz)?$")
+
+SENT = ("invite_sent", "invite_sent_manual")
+CONSUMED = ("invite_consumed", "invite_consumed_fallback")
+REVOKED = ("invite_revoked_on_request", "invite_revoked_old_for_target")
+EXPIRED = ("invite_expired",)
+FAILED = ("invite_error", "invite_consume_err", "invite_consume_err_fallback", "revoke_err")
+
+MARK_EVERY = 1 << 20
+INDEX_BATCH = 20000
+KEY_FIELDS = ("target", "link")
+JOIN_HORIZON = 2 * 86400
+RAW_DECODE = json.JSONDecoder().raw_decode
+ACTION_RE = re.compile(rb'"action": "([^"]*)"')
+
+
+def audit_segments(path: str) -> list:
+    found = {}
+    for seg in glob.glob(glob.escape(path) + ".*"):
+        m = SEGMENT_RE.search(seg[len(path):])
+        if m and (m.group(1) not in found or not m.group(2)):
+            found[m.group(1)] = seg
+    return [found[k] for k in sorted(found)] + ([path] if os.path.exists(path) else [])
+
+
+def open_segment(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def decode(line: bytes) -> dict:
+    return RAW_DECODE(line.decode("utf-8"))[0]
+
+
+_TS_LAST = [None, None]
+
+
+def parse_ts(value) -> Optional[float]:
+    if value == _TS_LAST[0]:
+        return _TS_LAST[1]
+    try:
+        ts = datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    _TS_LAST[0], _TS_LAST[1] = value, ts
+    return ts
+
+
+def parse_bound(value: Optional[str], end: bool = False) -> Optional[float]:
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        dt += timedelta(days=1)
+    return dt.timestamp()
+
+
+def read_lines(path: str, start: int = 0):
+    with open_segment(path) as f:
+        if start:
+            f.seek(start)
+        off = start
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            yield off, line
+            off += len(line)
+
+
+class AuditIndex:
+    def __init__(self, path: str, log_path: str):
+        self.path = path
+        self.log_path = log_path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "id INTEGER PRIMARY KEY, name TEXT UNIQUE, ino INTEGER, size INTEGER, pos INTEGER, "
+            "first_ts REAL, last_ts REAL, records INTEGER DEFAULT 0)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS marks (seg INTEGER, off INTEGER, ts REAL, PRIMARY KEY (seg, off)) WITHOUT ROWID"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS keys (key TEXT, seg INTEGER, off INTEGER, PRIMARY KEY (key, seg, off)) "
+            "WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _drop(self, seg: int):
+        with self.db:
+            self.db.execute("DELETE FROM keys WHERE seg=?", (seg,))
+            self.db.execute("DELETE FROM marks WHERE seg=?", (seg,))
+            self.db.execute("DELETE FROM segments WHERE id=?", (seg,))
+
+    def update(self) -> int:
+        paths = audit_segments(self.log_path)
+        names = {os.path.basename(p) for p in paths}
+        for seg, name in self.db.execute("SELECT id, name FROM segments").fetchall():
+            if name not in names:
+                self._drop(seg)
+        n = 0
+        for p in paths:
+            st = os.stat(p)
+            row = self.db.execute(
+                "SELECT id, ino, size, pos, first_ts, last_ts FROM segments WHERE name=?", (os.path.basename(p),)
+            ).fetchone()
+            if row and row[1] == st.st_ino and row[2] == st.st_size:
+                continue
+            if row and (row[1] != st.st_ino or row[2] > st.st_size or p.endswith(".gz")):
+                self._drop(row[0])
+                row = None
+            n += self._index(p, st, row)
+        return n
+
+    def _index(self, path: str, st: os.stat_result, row) -> int:
+        if row is None:
+            with self.db:
+                seg = self.db.execute(
+                    "INSERT INTO segments (name, ino, size, pos) VALUES (?, ?, 0, 0)", (os.path.basename(path), st.st_ino)
+                ).lastrowid
+            start, first, last = 0, None, None
+        else:
+            seg, _, _, start, first, last = row
+        keys = []
+        marks = []
+        next_mark = start
+        end = start
+        n = total = 0
+        for off, line in read_lines(path, start):
+            end = off + len(line)
+            try:
+                rec = decode(line)
+            except ValueError:
+                continue
+            ts = parse_ts(rec.get("time"))
+            if ts is None:
+                continue
+            if off >= next_mark:
+                marks.append((seg, off, last if last is not None else ts))
+                next_mark = off + MARK_EVERY
+            first = ts if first is None else min(first, ts)
+            last = ts if last is None else max(last, ts)
+            for field in KEY_FIELDS:
+                v = rec.get(field)
+                if v is not None:
+                    keys.append((f"{field}:{v}", seg, off))
+            n += 1
+            if len(keys) >= INDEX_BATCH:
+                self._write(seg, keys, marks, None, end, first, last, n)
+                total += n
+                keys, marks, n = [], [], 0
+        size = st.st_size if path.endswith(".gz") else end
+        self._write(seg, keys, marks, size, end, first, last, n)
+        return total + n
+
+    def _write(self, seg: int, keys: list, marks: list, size: Optional[int], pos: int, first, last, n: int):
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO keys (key, seg, off) VALUES (?, ?, ?)", keys)
+            self.db.executemany("INSERT OR IGNORE INTO marks (seg, off, ts) VALUES (?, ?, ?)", marks)
+            self.db.execute(
+                "UPDATE segments SET size=COALESCE(?, size), pos=?, first_ts=?, last_ts=?, records=records+? "
+                "WHERE id=?",
+                (size, pos, first, last, n, seg)
+            )
+
+    def segment(self, path: str):
+        return self.db.execute(
+            "SELECT id, first_ts, last_ts, size FROM segments WHERE name=?", (os.path.basename(path),)
+        ).fetchone()
+
+    def seek(self, seg: int, since: float) -> int:
+        row = self.db.execute(
+            "SELECT off FROM marks WHERE seg=? AND ts<? ORDER BY off DESC LIMIT 1", (seg, since)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def lookup(self, key: str) -> dict:
+        out = {}
+        for seg, off in self.db.execute("SELECT seg, off FROM keys WHERE key=? ORDER BY seg, off", (key,)):
+            out.setdefault(seg, []).append(off)
+        return out
+
+
+def action_filter(actions):
+    if not actions:
+        return None
+    wanted = {a.encode() for a in actions}
+
+    def keep(line: bytes) -> bool:
+        m = ACTION_RE.search(line)
+        return m is not None and m.group(1) in wanted
+    return keep
+
+
+def iter_records(log_path: str, since: Optional[float] = None, until: Optional[float] = None,
+                 index: Optional[AuditIndex] = None, actions=None):
+    keep = action_filter(actions)
+    for path in audit_segments(log_path):
+        start = 0
+        if index is not None:
+            row = index.segment(path)
+            if row and row[1] is not None:
+                if (since is not None and row[2] < since) or (until is not None and row[1] >= until):
+                    continue
+                if since is not None:
+                    start = index.seek(row[0], since)
+        for _, line in read_lines(path, start):
+            if keep is not None and not keep(line):
+                continue
+            try:
+                rec = decode(line)
+            except ValueError:
+                continue
+            ts = parse_ts(rec.get("time"))
+            if ts is None or (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            yield ts, rec
+
+
+def iter_key(log_path: str, field: str, value, index: Optional[AuditIndex] = None):
+    if index is None:
+        needle = json.dumps({field: value}, ensure_ascii=False)[1:-1].encode()
+        for path in audit_segments(log_path):
+            for _, line in read_lines(path):
+                if needle not in line:
+                    continue
+                rec = decode(line)
+                if rec.get(field) == value:
+                    yield parse_ts(rec.get("time")), rec
+        return
+    hits = index.lookup(f"{field}:{value}")
+    for path in audit_segments(log_path):
+        row = index.segment(path)
+        offs = hits.get(row[0]) if row else None
+        if not offs:
+            continue
+        with open_segment(path) as f:
+            for off in offs:
+                f.seek(off)
+                rec = decode(f.readline())
+                yield parse_ts(rec.get("time")), rec
+
+
+class Buckets:
+    BOUNDS = tuple(round(1.5 ** k, 3) for k in range(42))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.n += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = self.BOUNDS[i - 1] if i > 0 else 0.0
+                hi = self.BOUNDS[i] if i < len(self.BOUNDS) else self.BOUNDS[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.BOUNDS[-1]
+
+
+def fmt_sec(sec: float) -> str:
+    if sec < 120:
+        return f"{sec:.0f}s"
+    if sec < 7200:
+        return f"{sec / 60:.1f}m"
+    return f"{sec / 3600:.1f}h"
+
+
+class ActionsReport:
+    actions = None
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts = {}
+        self.first = None
+        self.last = None
+
+    def feed(self, ts: float, rec: dict):
+        a = rec.get("action")
+        self.counts[a] = self.counts.get(a, 0) + 1
+        if self.first is None:
+            self.first = rec.get("time")
+        self.last = rec.get("time")
+
+    def lines(self) -> list:
+        total = sum(self.counts.values())
+        out = [f"{total} records, {self.first or '-'} .. {self.last or '-'}"]
+        for a, c in sorted(self.counts.items(), key=lambda kv: -kv[1])[:self.limit]:
+            out.append(f"  {a:<34} {c}")
+        if len(self.counts) > self.limit:
+            out.append(f"  ({len(self.counts) - self.limit} more actions)")
+        return out
+
+
+class DailyReport:
+    actions = SENT + CONSUMED + REVOKED + EXPIRED + FAILED
+    COLS = (("sent", SENT), ("joined", CONSUMED), ("revoked", REVOKED), ("expired", EXPIRED), ("failed", FAILED))
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.rows = {}
+        self.col = {a: i for i, (_, acts) in enumerate(self.COLS) for a in acts}
+
+    def feed(self, ts: float, rec: dict):
+        key = (rec["time"][:10], rec.get("tier") or "-")
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = [0] * len(self.COLS)
+        row[self.col[rec["action"]]] += 1
+
+    def lines(self) -> list:
+        head = "  ".join(f"{c:>7}" for c, _ in self.COLS)
+        out = [f"{'day':<10}  {'tier':<8}  {head}"]
+        keys = sorted(self.rows)
+        days = sorted({d for d, _ in keys})[-self.limit:]
+        totals = [0] * len(self.COLS)
+        for d, tier in keys:
+            row = self.rows[(d, tier)]
+            totals = [a + b for a, b in zip(totals, row)]
+            if d in days:
+                out.append(f"{d:<10}  {tier:<8}  " + "  ".join(f"{v:>7}" for v in row))
+        out.append(f"{'total':<10}  {'':<8}  " + "  ".join(f"{v:>7}" for v in totals))
+        return out
+
+
+class PendingInvites:
+    def __init__(self, horizon: float):
+        self.horizon = horizon
+        self.links = OrderedDict()
+
+    def sent(self, ts: float, rec: dict) -> list:
+        self.links[rec.get("link")] = (ts, rec.get("target"), rec.get("tier"))
+        return self.evict(ts)
+
+    def joined(self, rec: dict):
+        return self.links.pop(rec.get("link"), None)
+
+    def evict(self, now: float) -> list:
+        out = []
+        while self.links:
+            link, item = next(iter(self.links.items()))
+            if item[0] > now - self.horizon:
+                break
+            del self.links[link]
+            out.append(item)
+        return out
+
+
+class LatencyReport:
+    actions = SENT + CONSUMED
+
+    def __init__(self, limit: int, horizon: float = JOIN_HORIZON):
+        self.pending = PendingInvites(horizon)
+        self.by_tier = {}
+        self.all = Buckets()
+        self.orphans = 0
+
+    def feed(self, ts: float, rec: dict):
+        if rec["action"] in SENT:
+            self.pending.sent(ts, rec)
+            return
+        hit = self.pending.joined(rec)
+        if hit is None:
+            self.orphans += 1
+            return
+        dt = max(0.0, ts - hit[0])
+        self.all.add(dt)
+        tier = hit[2] or "-"
+        b = self.by_tier.get(tier)
+        if b is None:
+            b = self.by_tier[tier] = Buckets()
+        b.add(dt)
+
+    def lines(self) -> list:
+        out = [f"{'tier':<10} {'joins':>7} {'p50':>8} {'p90':>8} {'mean':>8}"]
+        for tier, b in sorted(self.by_tier.items()) + [("all", self.all)]:
+            if b.n:
+                out.append(f"{tier:<10} {b.n:>7} {fmt_sec(b.quantile(0.5)):>8} {fmt_sec(b.quantile(0.9)):>8} "
+                           f"{fmt_sec(b.total / b.n):>8}")
+        out.append(f"joins without a sent invite in range: {self.orphans}")
+        return out
+
+
+class NoJoinReport:
+    actions = SENT + CONSUMED
+
+    def __init__(self, limit: int, horizon: float = JOIN_HORIZON):
+        self.limit = limit
+        self.pending = PendingInvites(horizon)
+        self.expired = 0
+        self.sample = OrderedDict()
+        self.last_ts = None
+
+    def _missed(self, items: list):
+        for _, target, tier in items:
+            self.expired += 1
+            if target is not None and len(self.sample) < self.limit:
+                self.sample[target] = tier
+
+    def feed(self, ts: float, rec: dict):
+        self.last_ts = ts
+        if rec["action"] in SENT:
+            self._missed(self.pending.sent(ts, rec))
+            return
+        self.pending.joined(rec)
+        self.sample.pop(rec.get("target"), None)
+
+    def lines(self) -> list:
+        if self.last_ts is not None:
+            self._missed(self.pending.evict(self.last_ts))
+        out = [f"invites never joined: {self.expired}, still within join window: {len(self.pending.links)}"]
+        if self.sample:
+            out.append(f"targets that never joined (up to {self.limit}):")
+            out += [f"  {t}  {tier or '-'}" for t, tier in self.sample.items()]
+        return out
+
+
+class TimelineReport:
+    actions = None
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.n = 0
+        self.rows = []
+
+    def feed(self, ts: float, rec: dict):
+        self.n += 1
+        if len(self.rows) < self.limit:
+            extra = " ".join(f"{k}={rec[k]}" for k in ("tier", "target", "link", "err") if rec.get(k) is not None)
+            self.rows.append(f"{rec.get('time')}  {rec.get('action')}  {extra}")
+
+    def lines(self) -> list:
+        out = [f"{self.n} records"] + self.rows
+        if self.n > len(self.rows):
+            out.append(f"({self.n - len(self.rows)} more)")
+        return out
+
+
+REPORTS = {
+    "actions": ActionsReport,
+    "daily": DailyReport,
+    "latency": LatencyReport,
+    "nojoin": NoJoinReport,
+    "target": TimelineReport,
+    "link": TimelineReport,
+}
+
+
+def default_index_path(log_path: str) -> str:
+    return os.path.join(os.path.dirname(log_path), "audit_index.sqlite3")
+
+
+def run_report(name: str, log_path: str, since: Optional[float] = None, until: Optional[float] = None,
+               tier: Optional[str] = None, value=None, limit: int = 20, index_path: Optional[str] = None) -> list:
+    started = time.monotonic()
+    index = None
+    indexed = 0
+    if index_path:
+        index = AuditIndex(index_path, log_path)
+        indexed = index.update()
+    try:
+        rep = REPORTS[name](limit)
+        n = 0
+        if name in ("target", "link"):
+            if name == "target":
+                value = int(value)
+            stream = iter_key(log_path, name, value, index)
+            stream = ((ts, r) for ts, r in stream if ts is not None
+                      and (since is None or ts >= since) and (until is None or ts < until))
+        else:
+            stream = iter_records(log_path, since, until, index, rep.actions)
+        for ts, rec in stream:
+            if tier and rec.get("tier") != tier:
+                continue
+            rep.feed(ts, rec)
+            n += 1
+        out = rep.lines()
+    finally:
+        if index is not None:
+            index.close()
+    took = time.monotonic() - started
+    note = f"[{name}] {n} records in {took:.2f}s"
+    if indexed:
+        note += f", {indexed} newly indexed"
+    return [note] + out
+
+
+def cfg_log_paths(cfg_path: str) -> tuple:
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        sto = json.load(f).get("storage", {})
+    log_path = sto.get("invite_log", os.path.join("data", "invite_audit.jsonl"))
+    return log_path, sto.get("audit_index", default_index_path(log_path))
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Stream reports over the invite audit log and its rotated segments.")
+    ap.add_argument("report", choices=sorted(REPORTS), nargs="?", default="daily")
+    ap.add_argument("value", nargs="?", help="target id or link for the target/link reports")
+    ap.add_argument("--config", default="config.json", help="read storage.invite_log / storage.audit_index from here")
+    ap.add_argument("--log", help="audit log path (overrides --config)")
+    ap.add_argument("--index", help="sqlite index path (default next to the log)")
+    ap.add_argument("--no-index", action="store_true", help="plain scan, do not build or use the index")
+    ap.add_argument("--from", dest="since", help="start date/time, ISO (YYYY-MM-DD or full timestamp)")
+    ap.add_argument("--to", dest="until", help="end date/time, ISO; a bare date includes that whole day")
+    ap.add_argument("--tier", help="only records for this tier, e.g. linkv1")
+    ap.add_argument("--limit", type=int, default=20, help="rows / days / samples to print")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    log_path, index_path = args.log, args.index
+    if log_path is None:
+        log_path, cfg_index = cfg_log_paths(args.config)
+        index_path = index_path or cfg_index
+    if args.no_index:
+        index_path = None
+    elif index_path is None:
+        index_path = default_index_path(log_path)
+    if args.report in ("target", "link") and not args.value:
+        sys.exit(f"{args.report} report needs a value")
+    lines = run_report(
+        args.report, log_path, parse_bound(args.since), parse_bound(args.until, end=True),
+        args.tier, args.value, args.limit, index_path
+    )
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
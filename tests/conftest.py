@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import importlib
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def usher_config(workdir: str) -> dict:
+    return {
+        "telegram": {"api_id": 1, "api_hash": "0", "session": "test", "string_session": "",
+                     "prefer_string_session": True},
+        "admin": {"admin_ids": [100]},
+        "bot_target": {"username": "test_bot", "commands": {"v1": "/addv1"}},
+        "behavior": {"dedupe_cache_sec": 60},
+        "vip_invite": {"map": {"linkv1": "-1009000000001"}},
+        "storage": {
+            "notes": os.path.join(workdir, "data", "notes.json"),
+            "invite_log": os.path.join(workdir, "data", "invite_audit.jsonl"),
+        },
+    }
+
+
+@pytest.fixture(scope="session")
+def usher(tmp_path_factory):
+    workdir = str(tmp_path_factory.mktemp("usher"))
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(usher_config(workdir), f)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    try:
+        mod = importlib.import_module("main")
+    finally:
+        os.chdir(cwd)
+    yield mod
+    mod.AUDIT.close()
@@ -0,0 +1,17 @@
+def test_one_target_per_line_or_field(usher):
+    out, rejected = usher.parse_bulk_targets(["12345,@alice_1", "678901\n @Bob_22 \n\n12345, @ALICE_1"])
+    assert out == ["12345", "@alice_1", "678901", "@Bob_22"]
+    assert rejected == []
+
+
+def test_numbers_inside_prose_are_rejected(usher):
+    text = "Transfer 150000 tanggal 20261016\n5551234\norder #884422\n@ab"
+    out, rejected = usher.parse_bulk_targets([text])
+    assert out == ["5551234"]
+    assert rejected == ["Transfer 150000 tanggal 20261016", "order #884422", "@ab"]
+
+
+def test_short_numbers_are_not_targets(usher):
+    out, rejected = usher.parse_bulk_targets(["1234", "-1001234567"])
+    assert out == []
+    assert rejected == ["1234", "-1001234567"]
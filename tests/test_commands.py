@@ -0,0 +1,24 @@
+def parse(usher, text):
+    if not usher.COMMANDS.table:
+        usher.COMMANDS.build()
+    return usher.COMMANDS.parse(text)
+
+
+def test_name_and_args(usher):
+    cmd = parse(usher, ".linkv1 12345")
+    assert (cmd.name, cmd.kind, cmd.tier, cmd.args, cmd.target_token) == ("linkv1", "linkv", "1", ["12345"], "12345")
+
+
+def test_any_whitespace_after_name(usher):
+    cmd = parse(usher, ".bulkaddv1\n12345\n67890")
+    assert cmd.kind == "bulkaddv"
+    assert cmd.args == ["12345", "67890"]
+    assert cmd.tail == "12345\n67890"
+    assert parse(usher, ".linkv1\t12345").args == ["12345"]
+
+
+def test_bare_and_unknown_commands(usher):
+    assert parse(usher, ".help").tail == ""
+    assert parse(usher, ".LINKV1 @alice_1").name == "linkv1"
+    assert parse(usher, ".nope 1") is None
+    assert parse(usher, "linkv1 12345") is None
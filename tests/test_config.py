@@ -0,0 +1,24 @@
+import copy
+
+import pytest
+
+
+def test_module_settings_come_from_cfg_settings(usher):
+    for name, value in usher.cfg_settings(usher.CFG).items():
+        assert getattr(usher, name) == value, name
+
+
+def test_rates_follow_watch_rate_and_overrides(usher):
+    cfg = copy.deepcopy(usher.CFG)
+    cfg["behavior"]["watch_rpc_per_sec"] = 7
+    cfg["rpc"] = {"rates": {"send_message": [1, 2]}}
+    s = usher.cfg_settings(cfg)
+    assert s["RPC_RATES"]["GetExportedChatInvitesRequest"] == (7.0, 1)
+    assert s["RPC_RATES"]["send_message"] == (1, 2)
+
+
+def test_check_settings_rejects_bad_template(usher):
+    cfg = copy.deepcopy(usher.CFG)
+    cfg["vip_invite"]["template"] = "Akses {tier} {missing}"
+    with pytest.raises(ValueError):
+        usher.check_settings(usher.cfg_settings(cfg))
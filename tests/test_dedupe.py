@@ -0,0 +1,63 @@
+import time
+
+
+def test_repeat_within_ttl_is_duplicate(usher):
+    c = usher.DedupeCache(60)
+    assert not c.check(("linkv", 1))
+    assert c.check(("linkv", 1))
+    assert not c.check(("linkv", 2))
+
+
+def test_zero_ttl_never_dedupes(usher):
+    c = usher.DedupeCache(0)
+    assert not c.check("k")
+    assert not c.check("k")
+    assert len(c) == 0
+
+
+def test_key_expires_after_ttl(usher):
+    c = usher.DedupeCache(0.05)
+    assert not c.check("k")
+    time.sleep(0.1)
+    assert not c.check("k")
+    assert c.check("k")
+
+
+def test_ttl_shrunk_live_uses_each_key_expiry(usher):
+    c = usher.DedupeCache(600)
+    c.check("old")
+    c.ttl = 0.1
+    assert not c.check("new")
+    time.sleep(0.2)
+    assert not c.check("new")
+    assert c.check("old")
+
+
+def test_discard_allows_retry(usher):
+    c = usher.DedupeCache(60)
+    c.check("k")
+    c.discard("k")
+    c.discard("missing")
+    assert not c.check("k")
+
+
+def msg(id_, chat_id, channel=False, private=False, text=".help", ts=1760000000):
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+    return SimpleNamespace(id=id_, chat_id=chat_id, sender_id=100, is_channel=channel, is_private=private,
+                           raw_text=text, date=datetime.fromtimestamp(ts, timezone.utc))
+
+
+def test_command_key_shared_across_accounts(usher):
+    assert usher.command_key(msg(5, -1001, channel=True)) == usher.command_key(msg(5, -1001, channel=True))
+    assert usher.command_key(msg(7, -42)) == usher.command_key(msg(9, -42))
+    assert usher.command_key(msg(7, -42)) != usher.command_key(msg(9, -42, text=".queue"))
+
+
+def test_command_key_private_ids_do_not_collide(usher):
+    token = usher.CURRENT_ACCOUNT.set(usher.Account("other", None, None, None))
+    try:
+        other = usher.command_key(msg(3, 100, private=True))
+    finally:
+        usher.CURRENT_ACCOUNT.reset(token)
+    assert usher.command_key(msg(3, 100, private=True)) != other
@@ -0,0 +1,43 @@
+def build(usher, notes: dict):
+    idx = usher.NoteIndex()
+    idx.rebuild({title: {"type": "text", "text": text} for title, text in notes.items()})
+    return idx
+
+
+def test_exact_title_ranks_first(usher):
+    idx = build(usher, {"promo": "", "promo besar": "", "harga": "promo"})
+    assert idx.search("promo", 10)[0] == "promo"
+
+
+def test_and_across_words_and_body(usher):
+    idx = build(usher, {"promo a besar": "", "promo kecil": "", "harga": "diskon besar"})
+    assert idx.search("besar promo", 10)[0] == "promo a besar"
+    assert "harga" in idx.search("diskon", 10)
+
+
+def test_single_letter_words_are_ignored_in_queries(usher):
+    idx = build(usher, {"promo a besar": "", "lain": ""})
+    assert idx.search("a promo", 10) == ["promo a besar"]
+    assert idx.search("promo a", 10)[0] == "promo a besar"
+
+
+def test_last_word_matches_as_prefix(usher):
+    idx = build(usher, {"katalog produk": "", "kontak": ""})
+    assert idx.search("katalog prod", 10)[0] == "katalog produk"
+
+
+def test_add_and_remove_keep_index_consistent(usher):
+    idx = build(usher, {"satu": "alpha"})
+    idx.add("dua", {"type": "text", "text": "alpha beta"})
+    assert set(idx.search("alpha", 10)) >= {"satu", "dua"}
+    idx.add("dua", {"type": "text", "text": "gamma"})
+    assert "dua" not in idx.search("beta", 10)
+    idx.remove("satu")
+    assert len(idx) == 1
+    assert "alpha" not in idx.postings
+    assert idx.titles == ["dua"]
+
+
+def test_fuzzy_fallback_on_typo(usher):
+    idx = build(usher, {"pengumuman": ""})
+    assert idx.search("pengumunan", 5) == ["pengumuman"]
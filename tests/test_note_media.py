@@ -0,0 +1,17 @@
+import os
+
+
+def test_blob_store_is_outside_per_title_dirs(usher):
+    media = os.path.normpath(usher.NOTES_MEDIA_DIR)
+    blobs = os.path.normpath(usher.NOTES_BLOB_DIR)
+    assert os.path.commonpath([media, blobs]) != media
+
+
+def test_only_legacy_media_notes_remove_their_dir(usher, tmp_path, monkeypatch):
+    monkeypatch.setattr(usher, "NOTES_MEDIA_DIR", str(tmp_path))
+    for title in ("blobs", "video", "fresh"):
+        (tmp_path / title).mkdir()
+    usher.drop_legacy_media("blobs", {"type": "text", "text": "hello"})
+    usher.drop_legacy_media("fresh", {"type": "photo", "media": {"blob": "ab", "path": "x"}})
+    usher.drop_legacy_media("video", {"type": "video", "media": {"path": str(tmp_path / "video" / "v.mp4")}})
+    assert sorted(os.listdir(tmp_path)) == ["blobs", "fresh"]
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+
+def test_link_added_during_poll_is_kept(usher):
+    w = usher.InviteWatchScheduler()
+    peer = -1009000000001
+
+    async def fetch(peer_id, links, a):
+        await asyncio.sleep(0.05)
+        w.add("linkv1", peer, "https://t.me/+B", 2)
+        return {link: 0 for link in links}
+
+    async def run():
+        w._fetch_counts = fetch
+        w.add("linkv1", peer, "https://t.me/+A", 1)
+        await w.stop()
+        await w._poll(peer)
+        await w.stop()
+
+    asyncio.run(run())
+    assert (peer, "https://t.me/+A") in w
+    assert (peer, "https://t.me/+B") in w
+    assert w.by_peer[peer]["https://t.me/+B"].due > time.time()
+
+
+def test_polled_link_missing_from_server_is_dropped(usher):
+    w = usher.InviteWatchScheduler()
+    peer = -1009000000001
+
+    async def fetch(peer_id, links, a):
+        return {}
+
+    async def run():
+        w._fetch_counts = fetch
+        w.add("linkv1", peer, "https://t.me/+A", 1)
+        await w.stop()
+        await w._poll(peer)
+
+    asyncio.run(run())
+    assert len(w) == 0